@@ -0,0 +1,152 @@
+import inspect
+import logging
+from typing import Iterable, Optional
+
+import scrapy
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+from scrapy.utils.asyncgen import as_async_generator
+
+from course_crawler.refcache import ReferenceCache
+
+
+logger = logging.getLogger(__name__)
+
+
+class BootstrapMixin(object):
+    """Fetches a spider's reference data (fee tables, language tests, module catalogues)
+    before its course lists.
+
+    The requests of `bootstrap_requests()` are sent concurrently, requests yielded by
+    their callbacks (e.g. one page per language profile) join the bootstrap phase. Once
+    every bootstrap request is done, whether it succeeded or failed, the requests of
+    `course_list_requests()` are released, so no course is parsed against a half-built
+    table. Should a bootstrap request never complete (e.g. dropped by a middleware),
+    the course lists are released when the spider goes idle.
+
+    The spider attributes named in `reference_attributes` are saved to the reference
+    cache once every bootstrap request succeeded. While the cache is fresh, they are
+    loaded from it and the bootstrap phase is skipped.
+
+        class BristolSpider(BootstrapMixin, scrapy.Spider):
+            def bootstrap_requests(self):
+                yield scrapy.Request(fees_url, callback=self.parse_tuitions)
+    """
+
+    # add to the spider's checkpoint_attributes, see course_crawler/checkpoint.py
+    checkpoint_attributes = ['bootstrap_pending', 'bootstrap_failed', 'bootstrap_released']
+
+    # tables built by the bootstrap callbacks, cached across runs, see course_crawler/refcache.py
+    reference_attributes = []
+
+    bootstrap_pending = 0
+    bootstrap_failed = 0
+    bootstrap_released = False
+    reference_sources = []
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(BootstrapMixin, cls).from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider._bootstrap_idle, signal=signals.spider_idle)
+        return spider
+
+    def bootstrap_requests(self) -> Iterable[scrapy.Request]:
+        return []
+
+    def course_list_requests(self) -> Iterable[scrapy.Request]:
+        for url in self.start_urls:
+            yield scrapy.Request(url=url, callback=self.parse_course_list)
+
+    def start_requests(self):
+        requests = list(self.bootstrap_requests())
+        self.reference_sources = [x.url for x in requests]
+        if requests and self._load_references():
+            requests = []
+
+        # every bootstrap request is counted before the first one can complete
+        requests = [self._bootstrap_request(x) for x in requests]
+        if not requests:
+            yield from self._release_course_lists()
+        yield from requests
+
+    def _bootstrap_request(self, request: scrapy.Request) -> scrapy.Request:
+        self.bootstrap_pending += 1
+        errback = getattr(request.errback, "__name__", None)
+        return request.replace(callback=self._bootstrap_response,
+                               errback=self._bootstrap_failure,
+                               dont_filter=True,
+                               meta={**request.meta,
+                                     'bootstrap_callback': getattr(request.callback, "__name__", "parse"),
+                                     'bootstrap_errback': errback})
+
+    def _reference_cache(self) -> Optional[ReferenceCache]:
+        if not self.reference_attributes:
+            return None
+        return ReferenceCache.from_settings(self.settings)
+
+    def _load_references(self) -> bool:
+        cache = self._reference_cache()
+        attributes = cache.load(self.name, self.reference_sources) if cache else None
+        if attributes is None or set(attributes) != set(self.reference_attributes):
+            return False
+
+        for attr, value in attributes.items():
+            setattr(self, attr, value)
+        logger.info("Loaded %(attributes)s from the reference cache",
+                    {"attributes": ", ".join(attributes)}, extra={"spider": self})
+        return True
+
+    def _save_references(self):
+        cache = self._reference_cache()
+        if cache is None:
+            return
+        if self.bootstrap_failed:
+            logger.warning("%(failed)d bootstrap requests failed, the reference cache is not updated",
+                           {"failed": self.bootstrap_failed}, extra={"spider": self})
+            return
+        cache.save(self.name, self.reference_sources, {x: getattr(self, x) for x in self.reference_attributes})
+
+    def _release_course_lists(self):
+        self.bootstrap_released = True
+        logger.info("Reference data loaded, releasing the course lists", extra={"spider": self})
+        yield from self.course_list_requests()
+
+    async def _bootstrap_output(self, output, failed: bool = False):
+        try:
+            if inspect.isawaitable(output):
+                output = await output
+            async for x in as_async_generator(output or []):
+                yield self._bootstrap_request(x) if isinstance(x, scrapy.Request) else x
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.bootstrap_pending -= 1
+            self.bootstrap_failed += failed
+
+        if self.bootstrap_pending == 0 and not self.bootstrap_released:
+            self._save_references()
+            for request in self._release_course_lists():
+                yield request
+
+    async def _bootstrap_response(self, response):
+        callback = getattr(self, response.meta['bootstrap_callback'])
+        async for x in self._bootstrap_output(callback(response)):
+            yield x
+
+    async def _bootstrap_failure(self, failure):
+        request = failure.request
+        logger.error("Bootstrap request %(request)s failed: %(error)s",
+                     {"request": request, "error": failure.value}, extra={"spider": self})
+        errback = getattr(self, request.meta['bootstrap_errback']) if request.meta.get('bootstrap_errback') else None
+        async for x in self._bootstrap_output(errback(failure) if errback else None, failed=True):
+            yield x
+
+    def _bootstrap_idle(self, spider):
+        if self.bootstrap_released:
+            return
+        logger.warning("Bootstrap phase incomplete (%(pending)d requests pending), releasing the course lists",
+                       {"pending": self.bootstrap_pending}, extra={"spider": self})
+        for request in self._release_course_lists():
+            self.crawler.engine.crawl(request)
+        raise DontCloseSpider
@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import logging
+from pathlib import Path
+from typing import Optional
+
+from twisted.internet import task
+from scrapy import signals
+from scrapy.http import Request
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.request import request_from_dict
+
+from course_crawler.sharding import shard_name
+
+
+logger = logging.getLogger(__name__)
+
+# request meta set by Scrapy and its middlewares, left out of the request key
+RUNTIME_META = {"depth", "download_slot", "download_latency", "download_timeout", "retry_times",
+                "redirect_times", "redirect_ttl", "redirect_urls", "redirect_reasons", "playwright_page",
+                "open_item"}
+
+# sent before a checkpoint is saved, receivers persist their own state and
+# return the requests they hold back from the scheduler, if any
+checkpoint_saving = object()
+
+
+def request_key(request: Request, fingerprinter) -> str:
+    """Identifies a request by its fingerprint, callback and scalar meta values.
+
+    Course requests are sent with dont_filter=True and the same URL for every
+    qualification, so the fingerprint alone can not tell them apart.
+    """
+    meta = {k: v for k, v in request.meta.items()
+            if k not in RUNTIME_META and isinstance(v, (str, int, float, bool))}
+    callback = getattr(request.callback, "__name__", None)
+    data = json.dumps([fingerprinter.fingerprint(request).hex(), callback, meta], sort_keys=True, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class CrawlCheckpoint(object):
+    """Saves the state of a crawl to CHECKPOINT_URI every CHECKPOINT_INTERVAL seconds, so that
+    an interrupted crawl resumes where it stopped.
+
+    A checkpoint holds the requests which are scheduled, downloading or whose callback
+    has not finished, the fingerprints seen by the dupefilter, the keys of the requests
+    whose callback finished and the spider attributes named in `checkpoint_attributes`
+    (e.g. fee and language tables). When a checkpoint exists, the spider attributes are
+    restored and the saved requests replace the start requests, requests which were
+    already processed are dropped from the callbacks' output. The checkpoint is removed
+    once the spider finishes.
+
+    The spider's timestamp is restored before the feeds and pipelines open, so a resumed
+    crawl continues the snapshot of the interrupted one, and `spider.resumed` is set,
+    see ManifestFileFeedStorage. Checkpoints older than `max_age` seconds are ignored and
+    a crawl closed for one of `discard_reasons` (e.g. by the extraction quality gate) is
+    started over.
+
+    Requests whose callback was running are replayed, so a resumed crawl may scrape some
+    courses again, the feeds, the buffered writer and the delta skip the courses which the
+    interrupted crawl already wrote.
+    """
+
+    def __init__(self, crawler, uri: str, interval: float, resume: bool, max_age: Optional[float] = None,
+                 discard_reasons: Optional[list] = None):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.uri = uri
+        self.interval = interval
+        self.resume = resume
+        self.max_age = max_age
+        self.discard_reasons = set(discard_reasons or [])
+
+        self.path = None
+        self.checkpoint = None
+        self.task = None
+        self.pending = {}
+        self.processing = {}
+        self.finished = set()
+        self.restored_keys = set()
+        self.restored_requests = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("CHECKPOINT_ENABLED"):
+            raise NotConfigured
+        middleware = cls(crawler, crawler.settings.get("CHECKPOINT_URI"),
+                         crawler.settings.getfloat("CHECKPOINT_INTERVAL"),
+                         crawler.settings.getbool("CHECKPOINT_RESUME"),
+                         crawler.settings.getfloat("CHECKPOINT_MAX_AGE") or None,
+                         crawler.settings.getlist("CHECKPOINT_DISCARD_REASONS"))
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(middleware.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(middleware.request_dropped, signal=signals.request_dropped)
+        crawler.signals.connect(middleware.request_left_downloader, signal=signals.request_left_downloader)
+        crawler.signals.connect(middleware.response_received, signal=signals.response_received)
+        middleware.read(crawler.spider)
+        return middleware
+
+    def _key(self, request: Request) -> str:
+        return request_key(request, self.crawler.request_fingerprinter)
+
+    def _dupefilter(self):
+        return getattr(self.crawler.engine.slot.scheduler, "df", None)
+
+    def read(self, spider):
+        """Reads the checkpoint of the spider, if any, and restores its timestamp."""
+        self.path = Path(self.uri % {"name": shard_name(spider)})
+        if not self.path.exists() or not self.resume:
+            return
+        age = time.time() - self.path.stat().st_mtime
+        if self.max_age and age > self.max_age:
+            logger.warning("Checkpoint %(path)s is %(days).1f days old, starting over",
+                           {"path": self.path, "days": age / 86400}, extra={"spider": spider})
+            return
+
+        with open(self.path, 'rb') as f:
+            self.checkpoint = pickle.load(f)
+        spider.timestamp = self.checkpoint["timestamp"] or spider.timestamp
+        spider.resumed = True
+
+    def spider_opened(self, spider):
+        if self.checkpoint is not None:
+            self.load(spider)
+        if self.interval:
+            self.task = task.LoopingCall(self.save, spider)
+            self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+        if reason == "finished" or reason in self.discard_reasons:
+            if self.path.exists():
+                os.remove(self.path)
+        else:
+            self.save(spider)
+            logger.info("Crawl closed (%(reason)s), resume it from the checkpoint %(path)s",
+                        {"reason": reason, "path": self.path}, extra={"spider": spider})
+
+    def request_scheduled(self, request, spider):
+        self.pending[id(request)] = request
+
+    def request_dropped(self, request, spider):
+        self.pending.pop(id(request), None)
+
+    def request_left_downloader(self, request, spider):
+        self.pending.pop(id(request), None)
+
+    def response_received(self, response, request, spider):
+        self.processing[id(request)] = request
+
+    def _request_done(self, request: Request):
+        if self.processing.pop(id(request), None) is not None:
+            self.finished.add(self._key(request))
+
+    def _keep(self, output, spider) -> bool:
+        if isinstance(output, Request) and self.restored_keys and self._key(output) in self.restored_keys:
+            self.stats.inc_value("checkpoint/skipped_requests", spider=spider)
+            return False
+        return True
+
+    def process_start_requests(self, start_requests, spider):
+        if self.restored_requests is None:
+            yield from start_requests
+        else:
+            yield from self.restored_requests
+
+    def process_spider_output(self, response, result, spider):
+        for output in result:
+            if self._keep(output, spider):
+                yield output
+        self._request_done(response.request)
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for output in result:
+            if self._keep(output, spider):
+                yield output
+        self._request_done(response.request)
+
+    def process_spider_exception(self, response, exception, spider):
+        self._request_done(response.request)
+
+    def _serialize(self, request: Request, spider) -> Optional[dict]:
+        if "playwright_page" in request.meta:
+            request = request.replace(meta={k: v for k, v in request.meta.items() if k != "playwright_page"})
+        try:
+            data = request.to_dict(spider=spider)
+            pickle.dumps(data, protocol=4)
+            return data
+        except (ValueError, TypeError, AttributeError, pickle.PicklingError):
+            return None
+
+    def save(self, spider):
+        held_requests = [x for _, result in self.crawler.signals.send_catch_log(checkpoint_saving, spider=spider)
+                         for x in (result or [])]
+        requests = []
+        for request in list(self.pending.values()) + list(self.processing.values()) + held_requests:
+            data = self._serialize(request, spider)
+            if data is None:
+                self.stats.inc_value("checkpoint/unserializable_requests", spider=spider)
+                logger.warning("Request %(request)s can not be serialized and is left out of the checkpoint",
+                               {"request": request}, extra={"spider": spider})
+            else:
+                requests.append(data)
+
+        dupefilter = self._dupefilter()
+        checkpoint = {
+            "spider": spider.name,
+            "timestamp": getattr(spider, "timestamp", None),
+            "requests": requests,
+            "finished": self.finished | self.restored_keys,
+            "fingerprints": set(getattr(dupefilter, "fingerprints", set())),
+            "attributes": {x: getattr(spider, x) for x in getattr(spider, "checkpoint_attributes", [])}
+        }
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(checkpoint, f, protocol=4)
+        os.replace(tmp_path, self.path)
+        self.stats.inc_value("checkpoint/saved", spider=spider)
+
+    def load(self, spider):
+        checkpoint, self.checkpoint = self.checkpoint, None
+        for attr, value in checkpoint["attributes"].items():
+            setattr(spider, attr, value)
+
+        dupefilter = self._dupefilter()
+        if hasattr(dupefilter, "fingerprints"):
+            dupefilter.fingerprints.update(checkpoint["fingerprints"])
+
+        # the fingerprints of the saved requests are in the dupefilter already
+        self.restored_requests = [request_from_dict(x, spider=spider).replace(dont_filter=True)
+                                  for x in checkpoint["requests"]]
+        self.restored_keys = checkpoint["finished"] | {self._key(x) for x in self.restored_requests}
+        self.stats.set_value("checkpoint/restored_requests", len(self.restored_requests), spider=spider)
+
+        logger.info("Resuming the crawl of %(timestamp)s from %(path)s: %(requests)d requests, "
+                    "%(finished)d finished requests, attributes %(attributes)s",
+                    {"timestamp": checkpoint["timestamp"], "path": self.path,
+                     "requests": len(self.restored_requests), "finished": len(checkpoint["finished"]),
+                     "attributes": ", ".join(checkpoint["attributes"]) or "-"}, extra={"spider": spider})
@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import mmap
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from course_crawler.snapshots import ReferenceTables, iter_course_spans
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+
+
+class CourseStore(object):
+    """Random access to the courses of a snapshot by link and qualification.
+
+    A sidecar index `<snapshot>.idx` maps every course to its byte offset and length
+    in the snapshot. It is built with a single streaming pass the first time a
+    snapshot is opened, and rebuilt whenever the snapshot size or mtime no longer
+    match. Single courses are then parsed straight from the memory-mapped snapshot.
+    """
+
+    def __init__(self, path: str, rebuild: bool = False):
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + INDEX_SUFFIX)
+
+        index = None if rebuild else self._load_index()
+        if index is None:
+            index = self._build_index()
+            self._save_index(index)
+
+        self.spans: Dict[Tuple[str, Optional[str]], List[Tuple[int, int]]] = {}
+        self.links: Dict[str, List[Tuple[str, Optional[str]]]] = {}
+        for link, qualification, offset, length in index["courses"]:
+            key = (link, qualification)
+            if key not in self.spans:
+                self.links.setdefault(link, []).append(key)
+            self.spans.setdefault(key, []).append((offset, length))
+
+        self.references = ReferenceTables(str(self.path))
+        self._file = open(self.path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if index["size"] else None
+
+    def _snapshot_stat(self) -> dict:
+        stat = self.path.stat()
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def _load_index(self) -> Optional[dict]:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, json.decoder.JSONDecodeError):
+            return None
+
+        stat = self._snapshot_stat()
+        if index.get("version") != INDEX_VERSION or index.get("size") != stat["size"] \
+                or index.get("mtime") != stat["mtime"]:
+            logger.info("Index of %s is stale, rebuilding" % self.path)
+            return None
+        return index
+
+    def _build_index(self) -> dict:
+        stat = self._snapshot_stat()
+        courses = [(course.get("link"), course.get("qualification"), offset, length)
+                   for course, offset, length in iter_course_spans(str(self.path))]
+        logger.info("Indexed %d courses of %s" % (len(courses), self.path))
+        return {"version": INDEX_VERSION, "snapshot": self.path.name, **stat, "courses": courses}
+
+    def _save_index(self, index: dict):
+        tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.warning("Could not save index %s: %s" % (self.index_path, e))
+
+    def _read(self, span: Tuple[int, int]) -> dict:
+        offset, length = span
+        return self.references.resolve(json.loads(self._mmap[offset:offset + length]))
+
+    def keys(self) -> List[Tuple[str, Optional[str]]]:
+        return list(self.spans.keys())
+
+    def get(self, link: str, qualification: Optional[str] = None) -> Optional[dict]:
+        """Returns the first course with the link, and the qualification when given."""
+        courses = self.get_all(link, qualification)
+        return courses[0] if courses else None
+
+    def get_all(self, link: str, qualification: Optional[str] = None) -> List[dict]:
+        """Returns every course with the link, and the qualification when given."""
+        keys = self.links.get(link, []) if qualification is None else [(link, qualification)]
+        return [self._read(span) for key in keys for span in self.spans.get(key, [])]
+
+    def __contains__(self, key) -> bool:
+        return key in self.spans if isinstance(key, tuple) else key in self.links
+
+    def __len__(self) -> int:
+        return sum(len(x) for x in self.spans.values())
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+if __name__ == "__main__":
+    # python -m course_crawler.course_store <snapshot> <link> [<qualification>]
+    logging.basicConfig(level=logging.INFO)
+
+    with CourseStore(sys.argv[1]) as store:
+        courses = store.get_all(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+    print(json.dumps(courses, ensure_ascii=False, indent=2))
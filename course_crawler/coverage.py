@@ -0,0 +1,37 @@
+from typing import Dict, Tuple
+
+
+SIMPLE_ATTRS = ["link", "title", "study_level", "qualification", "university_title",
+                "description", "about", "entry_requirements"]
+COMPLEX_ATTRS = ["locations", "start_dates", "application_dates"]
+NESTED_ATTRS = {
+    "tuitions": ["study_mode", "duration", "student_category", "fee"],
+    "language_requirements": ["language", "test", "score"],
+    "modules": ["type", "title", "link"]
+}
+
+
+def child_attribute(attr: str, child_attr: str) -> str:
+    """Name under which a nested attribute is reported, e.g. tuition__fee."""
+    return f"{attr[:-1]}__{child_attr}"
+
+
+def course_fill_counts(course: dict) -> Dict[str, Tuple[int, int]]:
+    """Returns (filled, count) per attribute of a single course.
+
+    Simple and complex attributes count once per course, nested child attributes
+    count once per nested item. A `<attr>_ref` id of the normalized output layout
+    counts as a filled nested attribute, its items are not available.
+    """
+    counts = {}
+    for attr in SIMPLE_ATTRS + COMPLEX_ATTRS:
+        counts[attr] = (1 if course.get(attr) else 0, 1)
+
+    for attr, child_attrs in NESTED_ATTRS.items():
+        items = course.get(attr) or []
+        filled = bool(items) or course.get(f"{attr}_ref") is not None
+        counts[attr] = (1 if filled else 0, 1)
+
+        for child_attr in child_attrs:
+            counts[child_attribute(attr, child_attr)] = (sum(1 for x in items if x.get(child_attr)), len(items))
+    return counts
@@ -0,0 +1,130 @@
+# Define here the item exporters used by the FEEDS setting
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/exporters.html
+import os
+import sys
+import json
+import shutil
+import logging
+from pathlib import Path
+from tempfile import TemporaryFile
+from typing import Iterable
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from scrapy.exporters import BaseItemExporter
+
+from course_crawler.items.course import Course
+from course_crawler.snapshots import iter_courses
+
+
+logger = logging.getLogger(__name__)
+
+# Excel cells hold at most 32,767 characters
+EXCEL_MAX_CELL_LENGTH = 32767
+
+CHILD_TABLES = {
+    "locations": ["value"],
+    "start_dates": ["value"],
+    "application_dates": ["value"],
+    "language_requirements": ["language", "test", "score"],
+    "modules": ["type", "title", "link"],
+    "tuitions": ["study_mode", "duration", "student_category", "fee"]
+}
+
+# columns of the courses sheet, unless FEED_EXPORT_FIELDS are given
+COURSE_COLUMNS = [x for x in Course.__fields__ if x not in CHILD_TABLES]
+
+
+def _cell(sheet, value):
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    if not isinstance(value, str):
+        return value
+
+    value = ILLEGAL_CHARACTERS_RE.sub("", value)[:EXCEL_MAX_CELL_LENGTH]
+    if value.startswith("="):
+        # scraped text, not a formula
+        cell = WriteOnlyCell(sheet, value)
+        cell.data_type = "s"
+        return cell
+    return value
+
+
+class CourseExcelItemExporter(BaseItemExporter):
+    """Exports courses into a write-only Excel workbook with one sheet per table.
+
+    The `courses` sheet holds the scalar fields of every course under a running
+    `course_id`, each list field from CHILD_TABLES gets its own sheet keyed by that id.
+    Rows are streamed to disk as they are appended, so memory stays constant whatever
+    the number of courses. The columns of the courses sheet are the fields of the Course
+    model (or FEED_EXPORT_FIELDS), other fields are logged and left out.
+    """
+
+    def __init__(self, file, **kwargs):
+        super().__init__(dont_fail=True, **kwargs)
+        self.file = file
+        self.workbook = None
+        self.sheets = {}
+        self.course_columns = [x for x in (self.fields_to_export or COURSE_COLUMNS) if x not in CHILD_TABLES]
+        self.skipped_fields = set()
+        self.course_id = 0
+
+    def start_exporting(self):
+        self.workbook = Workbook(write_only=True)
+        self.sheets["courses"] = self.workbook.create_sheet("courses")
+        self.sheets["courses"].append(["course_id", *self.course_columns])
+        for table, columns in CHILD_TABLES.items():
+            self.sheets[table] = self.workbook.create_sheet(table)
+            self.sheets[table].append(["course_id", *columns])
+
+    def export_item(self, item):
+        course = dict(self._get_serialized_fields(item))
+        self.course_id += 1
+
+        skipped = set(course) - set(self.course_columns) - set(CHILD_TABLES) - self.skipped_fields
+        if skipped:
+            logger.warning("Fields %s have no column in the courses sheet and are left out"
+                           % ", ".join(sorted(skipped)))
+            self.skipped_fields |= skipped
+
+        sheet = self.sheets["courses"]
+        sheet.append([self.course_id, *[_cell(sheet, course.get(x)) for x in self.course_columns]])
+
+        for table, columns in CHILD_TABLES.items():
+            sheet = self.sheets[table]
+            for row in course.get(table) or []:
+                if not isinstance(row, dict):
+                    row = {"value": row}
+                sheet.append([self.course_id, *[_cell(sheet, row.get(x)) for x in columns]])
+
+    def finish_exporting(self):
+        # feed files are opened for appending and cannot be seeked, the workbook is
+        # therefore written to a temporary file first and copied over
+        with TemporaryFile() as f:
+            self.workbook.save(f)
+            f.seek(0)
+            shutil.copyfileobj(f, self.file)
+
+
+def export_courses_to_excel(courses: Iterable[dict], excel_path: str):
+    """Streams courses, e.g. read with iter_courses from a snapshot, into an Excel workbook."""
+    Path(excel_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(excel_path, 'wb') as f:
+        exporter = CourseExcelItemExporter(f)
+        exporter.start_exporting()
+        for course in courses:
+            exporter.export_item(course)
+        exporter.finish_exporting()
+    logger.info("%d courses exported to path %s" % (exporter.course_id, excel_path))
+
+
+if __name__ == "__main__":
+    # python -m course_crawler.exporters <snapshot.json|snapshot.jsonl> [<workbook.xlsx>]
+    logging.basicConfig(level=logging.INFO)
+
+    snapshot_path = sys.argv[1]
+    excel_path = sys.argv[2] if len(sys.argv) > 2 else f"{os.path.splitext(snapshot_path)[0]}.xlsx"
+    export_courses_to_excel(iter_courses(snapshot_path), excel_path)
@@ -0,0 +1,193 @@
+# Define here the extensions of the crawler
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/extensions.html
+import os
+import json
+import logging
+from pathlib import Path
+from collections import deque
+
+from twisted.internet import task
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from course_crawler.coverage import course_fill_counts
+from course_crawler.sharding import shard_name
+
+
+logger = logging.getLogger(__name__)
+
+
+class FieldCoverageStats(object):
+    """Keeps running per-field fill counts of the scraped courses.
+
+    Every scraped course increments `coverage/<attr>/filled` and `coverage/<attr>/count`
+    in the crawler stats, nested child attributes (e.g. tuition__fee) are counted per
+    nested item. The fill rates are logged every COVERAGE_LOG_INTERVAL seconds and
+    `coverage/<attr>/nan_perc` is set when the spider closes.
+    """
+
+    def __init__(self, stats, interval: float):
+        self.stats = stats
+        self.interval = interval
+        self.task = None
+        self.attributes = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("COVERAGE_STATS_ENABLED"):
+            raise NotConfigured
+        extension = cls(crawler.stats, crawler.settings.getfloat("COVERAGE_LOG_INTERVAL"))
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.item_scraped, signal=signals.item_scraped)
+        return extension
+
+    def spider_opened(self, spider):
+        if self.interval:
+            self.task = task.LoopingCall(self.log, spider)
+            self.task.start(self.interval, now=False)
+
+    def item_scraped(self, item, spider):
+        self.stats.inc_value("coverage/courses", spider=spider)
+        for attr, (filled, count) in course_fill_counts(item).items():
+            self.attributes.setdefault(attr, None)
+            self.stats.inc_value(f"coverage/{attr}/filled", filled, spider=spider)
+            self.stats.inc_value(f"coverage/{attr}/count", count, spider=spider)
+
+    def fill_rates(self, spider) -> dict:
+        rates = {}
+        for attr in self.attributes:
+            count = self.stats.get_value(f"coverage/{attr}/count", 0, spider=spider)
+            filled = self.stats.get_value(f"coverage/{attr}/filled", 0, spider=spider)
+            rates[attr] = (filled / count) * 100 if count else None
+        return rates
+
+    def log(self, spider):
+        courses = self.stats.get_value("coverage/courses", 0, spider=spider)
+        rates = ", ".join("%s %s" % (attr, "%.0f%%" % rate if rate is not None else "-")
+                          for attr, rate in self.fill_rates(spider).items())
+        logger.info("Field coverage after %(courses)d courses: %(rates)s",
+                    {"courses": courses, "rates": rates or "-"}, extra={"spider": spider})
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+        for attr, rate in self.fill_rates(spider).items():
+            self.stats.set_value(f"coverage/{attr}/nan_perc", 100 - rate if rate is not None else 100.0,
+                                 spider=spider)
+        self.log(spider)
+
+
+class ExtractionQualityGate(object):
+    """Closes the spider when the rolling fill rate of key fields collapses.
+
+    After QUALITY_GATE_WARMUP courses, the fill rate of every field in
+    QUALITY_GATE_THRESHOLDS over the last QUALITY_GATE_WINDOW courses is compared with
+    its minimum rate (0 to 1). If any field falls below, the spider is closed with the
+    `extraction_quality_collapse` reason instead of crawling pages whose data is useless.
+    """
+
+    close_reason = "extraction_quality_collapse"
+
+    def __init__(self, crawler, thresholds: dict, warmup: int, window: int):
+        self.crawler = crawler
+        self.thresholds = thresholds
+        self.warmup = warmup
+
+        self.window = deque(maxlen=window)
+        self.filled = {field: 0 for field in thresholds}
+        self.items_seen = 0
+        self.closing = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("QUALITY_GATE_ENABLED"):
+            raise NotConfigured
+        extension = cls(crawler,
+                        thresholds=crawler.settings.getdict("QUALITY_GATE_THRESHOLDS"),
+                        warmup=crawler.settings.getint("QUALITY_GATE_WARMUP"),
+                        window=crawler.settings.getint("QUALITY_GATE_WINDOW"))
+        crawler.signals.connect(extension.item_scraped, signal=signals.item_scraped)
+        return extension
+
+    @staticmethod
+    def _is_filled(item, field: str) -> bool:
+        return bool(item.get(field)) or item.get(f"{field}_ref") is not None
+
+    def item_scraped(self, item, spider):
+        if self.closing:
+            return
+
+        if len(self.window) == self.window.maxlen:
+            for field, filled in zip(self.thresholds, self.window[0]):
+                self.filled[field] -= filled
+
+        filled = tuple(self._is_filled(item, field) for field in self.thresholds)
+        self.window.append(filled)
+        for field, is_filled in zip(self.thresholds, filled):
+            self.filled[field] += is_filled
+        self.items_seen += 1
+
+        if self.items_seen < self.warmup:
+            return
+
+        rates = {field: self.filled[field] / len(self.window) for field in self.thresholds}
+        collapsed = {field: rate for field, rate in rates.items() if rate < float(self.thresholds[field])}
+        if collapsed:
+            self.closing = True
+            logger.error("Extraction quality collapsed after %(items)d courses, fill rates over the last "
+                         "%(window)d courses: %(rates)s",
+                         {"items": self.items_seen, "window": len(self.window),
+                          "rates": ", ".join("%s %.0f%%" % (k, v * 100) for k, v in collapsed.items())},
+                         extra={"spider": spider})
+            self.crawler.stats.set_value("quality_gate/collapsed_fields", sorted(collapsed.keys()), spider=spider)
+            self.crawler.engine.close_spider(spider, self.close_reason)
+
+
+class StatsDump(object):
+    """Writes the crawl stats to STATS_DUMP_URI as JSON every STATS_DUMP_INTERVAL seconds and on close.
+
+    The file doubles as a heartbeat for the supervisor, which watches the
+    progress counters in it and reads `finish_reason` once the worker exits.
+    """
+
+    def __init__(self, stats, uri: str, interval: float):
+        self.stats = stats
+        self.uri = uri
+        self.interval = interval
+        self.path = None
+        self.task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.get("STATS_DUMP_URI"):
+            raise NotConfigured
+        extension = cls(crawler.stats, crawler.settings.get("STATS_DUMP_URI"),
+                        crawler.settings.getfloat("STATS_DUMP_INTERVAL"))
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        self.path = Path(self.uri % {"name": shard_name(spider)})
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.dump(spider)
+        if self.interval:
+            self.task = task.LoopingCall(self.dump, spider)
+            self.task.start(self.interval, now=False)
+
+    def dump(self, spider, reason=None):
+        stats = dict(self.stats.get_stats(spider))
+        if reason is not None:
+            stats.setdefault("finish_reason", reason)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, default=str, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+        self.dump(spider, reason)
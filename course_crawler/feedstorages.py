@@ -0,0 +1,341 @@
+# Define here the feed storages used by the FEEDS setting
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/feed-exports.html#storages
+import io
+import os
+import json
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+from collections import Counter
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from twisted.internet import reactor, threads
+from scrapy.exceptions import NotConfigured
+from scrapy.extensions.feedexport import FileFeedStorage, build_storage
+
+from course_crawler.snapshots import course_digest, iter_course_spans, snapshot_entry, update_manifest
+
+
+logger = logging.getLogger(__name__)
+
+# S3 rejects multipart parts smaller than 5 MiB (except for the last one)
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class _MultipartUploadFile(io.RawIOBase):
+    """Write-only file which uploads its content as S3 multipart parts while it is written.
+
+    Writes never block, full parts are handed to `max_pending_parts` upload threads.
+    Once that many parts are pending `on_full` is called (e.g. to pause the engine),
+    `on_drained` once an upload finished and a slot is free again. Both are called
+    in the reactor thread.
+    """
+
+    def __init__(self, client, bucket: str, key: str, upload_id: str, part_size: int, max_pending_parts: int,
+                 on_full=None, on_drained=None):
+        super().__init__()
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.upload_id = upload_id
+        self.part_size = part_size
+        self.max_pending_parts = max_pending_parts
+        self.on_full = on_full
+        self.on_drained = on_drained
+
+        self.buffer = bytearray()
+        self.futures = []
+        self.bytes_written = 0
+        self.sha256 = hashlib.sha256()
+
+        self.pending = 0
+        self.full = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_pending_parts, thread_name_prefix="s3-multipart")
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        self.buffer.extend(data)
+        self.bytes_written += len(data)
+        self.sha256.update(data)
+
+        while len(self.buffer) >= self.part_size:
+            self._submit_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+        return len(data)
+
+    def _submit_part(self, body: bytes):
+        with self._lock:
+            self.pending += 1
+            full = not self.full and self.pending >= self.max_pending_parts
+            self.full = self.full or full
+        if full and self.on_full:
+            reactor.callFromThread(self.on_full)
+
+        part_number = len(self.futures) + 1
+        future = self._executor.submit(self._upload_part, part_number, body)
+        future.add_done_callback(self._part_done)
+        self.futures.append(future)
+
+    def _part_done(self, future):
+        with self._lock:
+            self.pending -= 1
+            drained = self.full and self.pending < self.max_pending_parts
+            self.full = self.full and not drained
+        if drained and self.on_drained:
+            reactor.callFromThread(self.on_drained)
+
+    def _upload_part(self, part_number: int, body: bytes) -> dict:
+        response = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                           PartNumber=part_number, Body=body)
+        return {"PartNumber": part_number, "ETag": response["ETag"], "Size": len(body)}
+
+    def complete(self) -> list:
+        """Uploads the remaining buffer as the last part and completes the multipart upload."""
+        try:
+            if self.buffer or not self.futures:
+                self._submit_part(bytes(self.buffer))
+                self.buffer.clear()
+
+            parts = [future.result() for future in self.futures]
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                MultipartUpload={"Parts": [{"PartNumber": x["PartNumber"], "ETag": x["ETag"]} for x in parts]})
+        except Exception:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            raise
+        finally:
+            self._executor.shutdown(wait=True)
+            super().close()
+        return parts
+
+    def close(self):
+        # the upload is completed by the feed storage, see S3MultipartFeedStorage.store
+        pass
+
+
+class S3MultipartFeedStorage(object):
+    """Streams the feed to S3-compatible object storage as multipart parts during the crawl.
+
+    Parts of FEED_STORAGE_S3_PART_SIZE bytes are uploaded in background threads as soon
+    as the exporter has written them, so upload overlaps with crawling. While
+    FEED_STORAGE_S3_MAX_PENDING_PARTS parts are pending the engine is paused, so memory
+    stays bounded without blocking the reactor on a slow upload. Once the upload is completed a
+    manifest object describing the run is written next to the feed as `<key>.manifest.json`.
+
+    Set AWS_ENDPOINT_URL to use a local S3 stand-in such as MinIO or moto.
+    """
+
+    def __init__(self, uri, access_key=None, secret_key=None, session_token=None, endpoint_url=None,
+                 region_name=None, acl=None, part_size=8 * 1024 * 1024, max_pending_parts=4,
+                 stats=None, academic_year=None, crawler=None, *, feed_options=None):
+        try:
+            import boto3
+        except ImportError:
+            raise NotConfigured("missing boto3 library")
+
+        u = urlparse(uri)
+        self.bucket = u.hostname
+        self.key = u.path[1:]
+        self.manifest_key = f"{self.key}.manifest.json"
+        self.acl = acl
+        self.part_size = max(part_size, S3_MIN_PART_SIZE)
+        self.max_pending_parts = max(max_pending_parts, 1)
+        self.stats = stats
+        self.academic_year = academic_year
+        self.crawler = crawler
+
+        self.client = boto3.client("s3",
+                                   aws_access_key_id=u.username or access_key,
+                                   aws_secret_access_key=u.password or secret_key,
+                                   aws_session_token=session_token,
+                                   endpoint_url=endpoint_url,
+                                   region_name=region_name)
+
+        if feed_options and feed_options.get("overwrite", True) is False:
+            logger.warning("S3 does not support appending to files. To suppress this warning, "
+                           "remove the overwrite option from your FEEDS setting or set it to True.")
+
+        self.spider = None
+
+    @classmethod
+    def from_crawler(cls, crawler, uri, *, feed_options=None):
+        return build_storage(
+            cls,
+            uri,
+            access_key=crawler.settings["AWS_ACCESS_KEY_ID"],
+            secret_key=crawler.settings["AWS_SECRET_ACCESS_KEY"],
+            session_token=crawler.settings["AWS_SESSION_TOKEN"],
+            endpoint_url=crawler.settings["AWS_ENDPOINT_URL"] or None,
+            region_name=crawler.settings["AWS_REGION_NAME"] or None,
+            acl=crawler.settings["FEED_STORAGE_S3_ACL"] or None,
+            part_size=crawler.settings.getint("FEED_STORAGE_S3_PART_SIZE"),
+            max_pending_parts=crawler.settings.getint("FEED_STORAGE_S3_MAX_PENDING_PARTS"),
+            stats=crawler.stats,
+            academic_year=crawler.settings.get("ACADEMIC_YEAR"),
+            crawler=crawler,
+            feed_options=feed_options,
+        )
+
+    def open(self, spider):
+        self.spider = spider
+        kwargs = {"ACL": self.acl} if self.acl else {}
+        upload = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key, **kwargs)
+        return _MultipartUploadFile(self.client, self.bucket, self.key, upload["UploadId"],
+                                    self.part_size, self.max_pending_parts,
+                                    on_full=self._pause, on_drained=self._unpause)
+
+    @property
+    def engine(self):
+        return getattr(self.crawler, "engine", None)
+
+    def _pause(self):
+        if self.engine is None or not self.engine.running:
+            return
+        logger.info("%d parts of %s are pending, pausing the crawl until one is uploaded"
+                    % (self.max_pending_parts, self.key))
+        if self.stats:
+            self.stats.inc_value("feedexport/s3_paused")
+        self.engine.pause()
+
+    def _unpause(self):
+        if self.engine is not None and self.engine.paused:
+            self.engine.unpause()
+
+    def store(self, file):
+        return threads.deferToThread(self._store_in_thread, file)
+
+    def _store_in_thread(self, file: _MultipartUploadFile):
+        parts = file.complete()
+
+        manifest = {
+            "university": self.spider.name if self.spider else None,
+            "academic_year": self.academic_year,
+            "timestamp": getattr(self.spider, "timestamp", None),
+            "bucket": self.bucket,
+            "key": self.key,
+            "item_count": self.stats.get_value("item_scraped_count", 0) if self.stats else None,
+            "byte_size": file.bytes_written,
+            "sha256": file.sha256.hexdigest(),
+            "parts": parts
+        }
+        kwargs = {"ACL": self.acl} if self.acl else {}
+        self.client.put_object(Bucket=self.bucket, Key=self.manifest_key,
+                               Body=json.dumps(manifest).encode("utf-8"),
+                               ContentType="application/json", **kwargs)
+
+
+class ManifestFileFeedStorage(FileFeedStorage):
+    """Local file feed storage which records every stored feed in the manifest of its directory.
+
+    Once a feed file is closed its university, academic year, timestamp, item count,
+    byte size and sha256 are added to `manifest.json` next to it, see
+    course_crawler.snapshots.query_snapshots to look snapshots up. The feed of a crawl
+    which did not finish is marked `partial` with its finish reason.
+
+    A crawl resumed from a checkpoint (see course_crawler.checkpoint) keeps the timestamp
+    of the interrupted one, its courses are added to the interrupted JSON or JSON lines feed,
+    leaving out those the interrupted crawl already wrote.
+    """
+
+    def __init__(self, uri, stats=None, academic_year=None, *, feed_options=None):
+        super().__init__(uri, feed_options=feed_options)
+        self.stats = stats
+        self.academic_year = academic_year
+        self.format = (feed_options or {}).get("format")
+        self.spider = None
+
+    @classmethod
+    def from_crawler(cls, crawler, uri, *, feed_options=None):
+        return build_storage(
+            cls,
+            uri,
+            stats=crawler.stats,
+            academic_year=crawler.settings.get("ACADEMIC_YEAR"),
+            feed_options=feed_options,
+        )
+
+    @property
+    def interrupted_path(self) -> Path:
+        return Path(self.path + ".interrupted")
+
+    def open(self, spider):
+        self.spider = spider
+        if getattr(spider, "resumed", False) and Path(self.path).exists():
+            os.replace(self.path, self.interrupted_path)
+            logger.info("Resuming feed %s" % self.path)
+        return super().open(spider)
+
+    def store(self, file):
+        file.close()
+        return threads.deferToThread(self._store_in_thread)
+
+    def _merge_interrupted(self) -> Optional[int]:
+        """Writes the courses of the interrupted feed followed by the resumed ones, returns the number of courses.
+
+        Courses which the resumed crawl scraped again (requests in progress when it was
+        interrupted are replayed) are written once.
+        """
+        if self.format not in ("json", "jsonlines"):
+            logger.warning("Feeds in %s format can not be resumed, the courses of the interrupted crawl are left "
+                           "in %s" % (self.format, self.interrupted_path))
+            return None
+
+        written = Counter()
+        tmp_path = Path(self.path + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("[" if self.format == "json" else "")
+            interrupted_count = self._write_courses(f, self.interrupted_path, 0, written)
+            count = self._write_courses(f, Path(self.path), interrupted_count, written, skip_written=True)
+            f.write("\n]" if self.format == "json" else "")
+        os.replace(tmp_path, self.path)
+        self.interrupted_path.unlink()
+
+        logger.info("Feed %s resumed after %d courses, %d courses scraped again were skipped"
+                    % (self.path, interrupted_count, interrupted_count - sum(written.values())))
+        return count
+
+    def _write_courses(self, f, path: Path, count: int, written: Counter, skip_written: bool = False) -> int:
+        try:
+            for course, _, _ in iter_course_spans(str(path)):
+                digest = course_digest(course)
+                if skip_written and written[digest] > 0:
+                    written[digest] -= 1
+                    continue
+                if not skip_written:
+                    written[digest] += 1
+                if self.format == "json":
+                    f.write(",\n" if count else "\n")
+                f.write(json.dumps(course, ensure_ascii=False) + ("" if self.format == "json" else "\n"))
+                count += 1
+        except json.decoder.JSONDecodeError:
+            # e.g. the interrupted crawl was killed while writing
+            logger.warning("Feed %s is truncated, %d courses were read" % (path, count))
+        return count
+
+    def _store_in_thread(self):
+        item_count = self.stats.get_value("item_scraped_count", 0) if self.stats else None
+        if self.interrupted_path.exists():
+            merged_count = self._merge_interrupted()
+            item_count = item_count if merged_count is None else merged_count
+
+        finish_reason = self.stats.get_value("finish_reason") if self.stats else None
+        partial = {"partial": True, "finish_reason": finish_reason} \
+            if finish_reason not in (None, "finished") else {}
+        entry = snapshot_entry(self.path,
+                               university=self.spider.name if self.spider else None,
+                               academic_year=self.academic_year,
+                               timestamp=getattr(self.spider, "timestamp", None),
+                               item_count=item_count,
+                               format=self.format,
+                               **partial)
+        update_manifest(str(Path(self.path).parent), entry)
+        logger.info("Feed %s (%d items, %d bytes) added to the manifest"
+                    % (self.path, entry["item_count"] or 0, entry["byte_size"]))
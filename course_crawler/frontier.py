@@ -0,0 +1,262 @@
+import os
+import heapq
+import time
+import pickle
+import socket
+import sqlite3
+import logging
+from itertools import count
+from pathlib import Path
+from typing import Optional
+
+from scrapy import signals
+from scrapy.core.scheduler import BaseScheduler
+from scrapy.dupefilters import BaseDupeFilter
+from scrapy.exceptions import DontCloseSpider
+from scrapy.utils.misc import create_instance, load_object
+from scrapy.utils.request import request_from_dict
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    spider TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS requests_order ON requests (spider, priority DESC, id);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    spider TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    PRIMARY KEY (spider, fingerprint)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS nodes (
+    node TEXT NOT NULL,
+    spider TEXT NOT NULL,
+    started REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    idle INTEGER NOT NULL DEFAULT 0,
+    closed INTEGER NOT NULL DEFAULT 0,
+    enqueued INTEGER NOT NULL DEFAULT 0,
+    dequeued INTEGER NOT NULL DEFAULT 0,
+    duplicates INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (node, spider)
+);
+"""
+
+# seconds between two writes of the node heartbeat and counters
+HEARTBEAT_INTERVAL = 5.0
+
+
+def frontier_path(settings, spider_name: str) -> Path:
+    return Path(settings.get("FRONTIER_URI") % {"name": spider_name})
+
+
+def node_id(settings) -> str:
+    return settings.get("FRONTIER_NODE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def connect(path: Path) -> sqlite3.Connection:
+    """Opens the frontier database shared by every node, WAL lets the nodes read while one writes."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=60, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def crawl_finished(conn: sqlite3.Connection, spider_name: str, idle_timeout: float, reason: str) -> bool:
+    """True when a node closed with `finished` and no other node of the spider is still open,
+    the frontier of the crawl can then be cleared for the next one."""
+    if reason != "finished":
+        return False
+    return conn.execute("SELECT COUNT(*) FROM nodes WHERE spider = ? AND closed = 0 AND last_seen > ?",
+                        (spider_name, time.time() - idle_timeout)).fetchone()[0] == 0
+
+
+class FrontierDupeFilter(BaseDupeFilter):
+    """Request fingerprints shared by every node crawling a spider, see FrontierScheduler.
+
+    The fingerprints are deleted once the crawl finished, so that the next crawl of the spider
+    starts afresh, they are kept when it was interrupted.
+    """
+
+    def __init__(self, path: Path, spider_name: str, fingerprinter, debug: bool = False, idle_timeout: float = 60.0):
+        self.path = path
+        self.spider_name = spider_name
+        self.fingerprinter = fingerprinter
+        self.debug = debug
+        self.idle_timeout = idle_timeout
+        self.logdupes = True
+        self.conn = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(frontier_path(crawler.settings, crawler.spidercls.name), crawler.spidercls.name,
+                   crawler.request_fingerprinter, crawler.settings.getbool("DUPEFILTER_DEBUG"),
+                   crawler.settings.getfloat("FRONTIER_IDLE_TIMEOUT"))
+
+    def open(self):
+        self.conn = connect(self.path)
+
+    def request_seen(self, request) -> bool:
+        fingerprint = self.fingerprinter.fingerprint(request).hex()
+        cursor = self.conn.execute("INSERT OR IGNORE INTO fingerprints (spider, fingerprint) VALUES (?, ?)",
+                                   (self.spider_name, fingerprint))
+        return cursor.rowcount == 0
+
+    def close(self, reason):
+        if crawl_finished(self.conn, self.spider_name, self.idle_timeout, reason):
+            self.conn.execute("DELETE FROM fingerprints WHERE spider = ?", (self.spider_name,))
+            logger.info("Crawl finished, cleared the fingerprints of %(spider)s in %(path)s",
+                        {"spider": self.spider_name, "path": self.path})
+        self.conn.close()
+
+    def log(self, request, spider):
+        if self.debug:
+            logger.debug("Filtered duplicate request: %(request)s", {"request": request}, extra={"spider": spider})
+        elif self.logdupes:
+            logger.debug("Filtered duplicate request: %(request)s - no more duplicates will be shown "
+                         "(see DUPEFILTER_DEBUG to show all duplicates)", {"request": request}, extra={"spider": spider})
+            self.logdupes = False
+        spider.crawler.stats.inc_value("dupefilter/filtered", spider=spider)
+
+
+class FrontierScheduler(BaseScheduler):
+    """Scheduler whose pending requests live in a frontier shared by several crawl nodes.
+
+    Requests are serialized with request_to_dict and pickled into a SQLite database
+    at FRONTIER_URI, every node claims the highest priority request atomically. Requests
+    which can not be serialized (e.g. with a Playwright page or a lambda in meta) stay in
+    a local in-memory queue. A node whose frontier runs dry keeps its spider open while
+    other busy nodes were seen within FRONTIER_IDLE_TIMEOUT seconds, as they may still add
+    requests. Per-node counters are kept in the `nodes` table of the frontier.
+
+    The last node to close a finished crawl clears its requests and fingerprints, an interrupted
+    crawl leaves them for the next run to continue.
+    """
+
+    def __init__(self, crawler, dupefilter, path: Path, node: str, idle_timeout: float):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.df = dupefilter
+        self.path = path
+        self.node = node
+        self.idle_timeout = idle_timeout
+
+        self.spider = None
+        self.conn = None
+        self.local = []
+        self.local_counter = count()
+        self.counters = {"enqueued": 0, "dequeued": 0, "duplicates": 0}
+        self.last_heartbeat = 0.0
+        self.idle = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        dupefilter = create_instance(load_object(crawler.settings["DUPEFILTER_CLASS"]), crawler.settings, crawler)
+        scheduler = cls(crawler, dupefilter,
+                        path=frontier_path(crawler.settings, crawler.spidercls.name),
+                        node=node_id(crawler.settings),
+                        idle_timeout=crawler.settings.getfloat("FRONTIER_IDLE_TIMEOUT"))
+        crawler.signals.connect(scheduler.spider_idle, signal=signals.spider_idle)
+        return scheduler
+
+    def open(self, spider):
+        self.spider = spider
+        self.conn = connect(self.path)
+        now = time.time()
+        self.conn.execute("INSERT OR REPLACE INTO nodes (node, spider, started, last_seen) VALUES (?, ?, ?, ?)",
+                          (self.node, spider.name, now, now))
+        logger.info("Node %(node)s joined the frontier %(path)s with %(pending)d pending requests",
+                    {"node": self.node, "path": self.path, "pending": self._shared_count()},
+                    extra={"spider": spider})
+        return self.df.open()
+
+    def close(self, reason):
+        self._heartbeat(force=True, closed=True)
+        if crawl_finished(self.conn, self.spider.name, self.idle_timeout, reason):
+            self.conn.execute("DELETE FROM requests WHERE spider = ?", (self.spider.name,))
+        self.conn.close()
+        return self.df.close(reason)
+
+    def _heartbeat(self, force: bool = False, closed: bool = False):
+        now = time.time()
+        if not force and now - self.last_heartbeat < HEARTBEAT_INTERVAL:
+            return
+        self.last_heartbeat = now
+        self.conn.execute("UPDATE nodes SET last_seen = ?, idle = ?, closed = ?, enqueued = ?, dequeued = ?, "
+                          "duplicates = ? WHERE node = ? AND spider = ?",
+                          (now, int(self.idle), int(closed), self.counters["enqueued"], self.counters["dequeued"],
+                           self.counters["duplicates"], self.node, self.spider.name))
+
+    def _shared_count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM requests WHERE spider = ?", (self.spider.name,)).fetchone()[0]
+
+    def _serialize(self, request) -> Optional[bytes]:
+        try:
+            return pickle.dumps(request.to_dict(spider=self.spider), protocol=4)
+        except (ValueError, TypeError, AttributeError, pickle.PicklingError):
+            return None
+
+    def enqueue_request(self, request) -> bool:
+        if not request.dont_filter and self.df.request_seen(request):
+            self.df.log(request, self.spider)
+            self.counters["duplicates"] += 1
+            return False
+
+        data = self._serialize(request)
+        if data is not None:
+            self.conn.execute("INSERT INTO requests (spider, priority, data) VALUES (?, ?, ?)",
+                              (self.spider.name, request.priority, data))
+            self.stats.inc_value("frontier/enqueued/shared", spider=self.spider)
+        else:
+            heapq.heappush(self.local, (-request.priority, next(self.local_counter), request))
+            self.stats.inc_value("frontier/enqueued/local", spider=self.spider)
+
+        self.counters["enqueued"] += 1
+        self.idle = False
+        self.stats.inc_value("scheduler/enqueued", spider=self.spider)
+        self._heartbeat()
+        return True
+
+    def next_request(self):
+        request = None
+        if self.local:
+            request = heapq.heappop(self.local)[2]
+            self.stats.inc_value("frontier/dequeued/local", spider=self.spider)
+        else:
+            row = self.conn.execute(
+                "DELETE FROM requests WHERE id = (SELECT id FROM requests WHERE spider = ? "
+                "ORDER BY priority DESC, id LIMIT 1) RETURNING data", (self.spider.name,)).fetchone()
+            if row is not None:
+                request = request_from_dict(pickle.loads(row[0]), spider=self.spider)
+                self.stats.inc_value("frontier/dequeued/shared", spider=self.spider)
+
+        if request is not None:
+            self.counters["dequeued"] += 1
+            self.idle = False
+            self.stats.inc_value("scheduler/dequeued", spider=self.spider)
+        self._heartbeat()
+        return request
+
+    def has_pending_requests(self) -> bool:
+        if self.local:
+            return True
+        return self.conn.execute("SELECT EXISTS (SELECT 1 FROM requests WHERE spider = ?)",
+                                 (self.spider.name,)).fetchone()[0] == 1
+
+    def spider_idle(self, spider):
+        # idle nodes do not keep each other open, only nodes which may still add requests do
+        self.idle = True
+        self._heartbeat(force=True)
+        active = self.conn.execute("SELECT COUNT(*) FROM nodes WHERE spider = ? AND node != ? AND idle = 0 "
+                                   "AND closed = 0 AND last_seen > ?",
+                                   (spider.name, self.node, time.time() - self.idle_timeout)).fetchone()[0]
+        if active:
+            raise DontCloseSpider
+
+    def __len__(self) -> int:
+        return len(self.local) + self._shared_count()
@@ -0,0 +1,198 @@
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+
+CURRENCIES = {"£": "GBP", "gbp": "GBP", "$": "USD", "usd": "USD", "€": "EUR", "eur": "EUR"}
+
+# months per duration unit
+DURATION_UNITS = {"year": 12.0, "yr": 12.0, "month": 1.0, "week": 12 / 52, "day": 12 / 365}
+
+NUMBER_WORDS = {"one": "1", "two": "2", "three": "3", "four": "4", "five": "5", "six": "6",
+                "seven": "7", "eight": "8", "nine": "9", "ten": "10", "twelve": "12"}
+NUMBER_WORDS_RE = r"\b(?:" + "|".join(NUMBER_WORDS) + r")\b"
+
+# an amount next to its currency, e.g. `£12,000` or `9,250 gbp`, wins over numbers such as `2024/25` before it
+FEE_RE = r"(?P<symbol>£|\$|€|\b(?:gbp|usd|eur)\b)\s*(?P<symbol_amount>\d[\d,]*(?:\.\d+)?)" \
+         r"|(?P<code_amount>\d[\d,]*(?:\.\d+)?)\s*(?P<code>gbp|usd|eur)\b"
+# an amount without currency, looked up once year ranges such as `2024/25` or `2024-2025` are removed
+FEE_AMOUNT_RE = r"(?P<amount>\d[\d,]*(?:\.\d+)?)"
+YEAR_RANGE_RE = r"\b(?:19|20)\d{2}\s*(?:/|-|–|to)\s*(?:(?:19|20)\d{2}|\d{2})\b"
+DURATION_RE = r"(?P<min>\d+(?:\.\d+)?)\s*(?:(?:-|–|to|or)\s*(?P<max>\d+(?:\.\d+)?)\s*)?" \
+              r"(?P<unit>year|yr|month|week|day)"
+FULL_TIME_RE = r"full[\s-]*time"
+PART_TIME_RE = r"part[\s-]*time"
+
+TUITION_ATTRS = ["study_mode", "duration", "student_category", "fee"]
+
+# canonical name per English language test, the first matching pattern wins
+LANGUAGE_TESTS = {
+    "IELTS": r"ielts",
+    "TOEFL iBT": r"toefl",
+    "C2 Proficiency": r"c2\s*proficiency|\bcpe\b|cambridge (?:english[:\s]*)?proficiency",
+    "C1 Advanced": r"c1\s*advanced|\bcae\b|cambridge (?:english[:\s]*)?advanced",
+    "PTE Academic": r"\bpte\b|pearson",
+    "Duolingo English Test": r"duolingo",
+    "Trinity ISE": r"trinity|\bise\b",
+    "LanguageCert": r"languagecert",
+    "Oxford Test of English": r"oxford test of english"
+}
+SCORE_RE = r"(\d+(?:\.\d+)?)"
+OVERALL_SCORE_RE = r"(?P<before>\d+(?:\.\d+)?)\s*overall|overall[^\d]*(?P<after>\d+(?:\.\d+)?)"
+
+LANGUAGE_REQUIREMENT_ATTRS = ["language", "test", "score"]
+
+
+def normalize_fees(fees: pd.Series) -> pd.DataFrame:
+    """Parses fee strings such as `£31,200` or `9,250 GBP per year` into fee_amount and fee_currency.
+
+    The first amount with a currency is taken, e.g. for ranges or `2024/25 fee: £12,000`,
+    else the first number which is not part of a year range. Strings without an amount give NaN.
+    """
+    text = fees.astype("string").str.lower()
+    parts = text.str.extract(FEE_RE)
+    bare_amount = text.str.replace(YEAR_RANGE_RE, " ", regex=True).str.extract(FEE_AMOUNT_RE)["amount"]
+    amount = parts["symbol_amount"].fillna(parts["code_amount"]).fillna(bare_amount)
+    amount = pd.to_numeric(amount.str.replace(",", "", regex=False), errors="coerce").astype(float)
+    currency = parts["symbol"].fillna(parts["code"]).astype(object).map(CURRENCIES)
+    return pd.DataFrame({"fee_amount": amount, "fee_currency": currency.where(amount.notna())}, index=fees.index)
+
+
+def normalize_durations(durations: pd.Series) -> pd.DataFrame:
+    """Parses duration strings such as `1 Year`, `12 months full-time` or `3-4 years` into months.
+
+    Ranges give duration_months (lower bound) and duration_months_max, single values
+    have both set to the same number of months.
+    """
+    text = durations.astype("string").str.lower() \
+        .str.replace(NUMBER_WORDS_RE, lambda x: NUMBER_WORDS[x.group(0)], regex=True)
+    parts = text.str.extract(DURATION_RE)
+    months_per_unit = parts["unit"].map(DURATION_UNITS).astype(float)
+    minimum = pd.to_numeric(parts["min"], errors="coerce").astype(float) * months_per_unit
+    maximum = pd.to_numeric(parts["max"], errors="coerce").astype(float) * months_per_unit
+    return pd.DataFrame({"duration_months": minimum.round(1),
+                         "duration_months_max": maximum.fillna(minimum).round(1)}, index=durations.index)
+
+
+def _study_mode(text: pd.Series) -> pd.Series:
+    text = text.astype("string").str.lower()
+    study_mode = pd.Series(None, index=text.index, dtype=object)
+    study_mode[text.str.contains(FULL_TIME_RE, regex=True).fillna(False).astype(bool)] = "full-time"
+    study_mode[text.str.contains(PART_TIME_RE, regex=True).fillna(False).astype(bool)] = "part-time"
+    return study_mode
+
+
+def normalize_study_modes(study_modes: pd.Series, durations: pd.Series = None) -> pd.Series:
+    """Maps study modes to `full-time` or `part-time`, falling back to the duration text
+    (e.g. `2 years part-time`) when the study mode is missing or unknown."""
+    study_mode = _study_mode(study_modes)
+    if durations is not None:
+        study_mode = study_mode.fillna(_study_mode(durations))
+    return study_mode
+
+
+def tuitions_frame(courses: Iterable[dict]) -> pd.DataFrame:
+    """Returns one row per tuition of the courses, keyed by course link and qualification."""
+    rows = []
+    for course in courses:
+        for tuition in course.get("tuitions") or []:
+            rows.append({"link": course.get("link"), "qualification": course.get("qualification"),
+                         **{k: tuition.get(k) for k in TUITION_ATTRS}})
+    return pd.DataFrame(rows, columns=["link", "qualification"] + TUITION_ATTRS)
+
+
+def normalize_tuitions(tuitions_df: pd.DataFrame) -> pd.DataFrame:
+    """Adds typed fee_amount, fee_currency, duration_months, duration_months_max and
+    study_mode_normalized columns next to the raw tuition text."""
+    return pd.concat([tuitions_df,
+                      normalize_fees(tuitions_df["fee"]),
+                      normalize_durations(tuitions_df["duration"]),
+                      normalize_study_modes(tuitions_df["study_mode"], tuitions_df["duration"])
+                      .rename("study_mode_normalized")], axis=1)
+
+
+def normalize_language_tests(tests: pd.Series) -> pd.Series:
+    """Maps test names such as `IELTS Academic` or `TOEFL iBT, including the 'Home Edition'`
+    to a canonical name, unknown tests keep their stripped name."""
+    text = tests.astype("string").str.lower()
+    conditions = [text.str.contains(x, regex=True).fillna(False).astype(bool) for x in LANGUAGE_TESTS.values()]
+    canonical = np.select(conditions, list(LANGUAGE_TESTS.keys()), default=None)
+    return pd.Series(canonical, index=tests.index, dtype=object).fillna(tests.astype("string").str.strip())
+
+
+def normalize_language_scores(scores: pd.Series) -> pd.DataFrame:
+    """Parses score strings into the minimum overall_score and the lowest minimum component_score.
+
+    The overall score is the number next to `overall`, or the first number, e.g.
+    `Minimum overall score: 7.0, Minimum score per component: 6.5` gives 7.0 / 6.5 and
+    `6.5 (no less than 6.0 in each component)` 6.5 / 6.0. Every other number counts
+    as a component minimum, component_score is NaN when no component minimum is given.
+    """
+    text = scores.astype("string").str.lower()
+    overall = text.str.extract(OVERALL_SCORE_RE)
+    overall = overall["before"].fillna(overall["after"]).fillna(text.str.extract(SCORE_RE)[0])
+    overall = pd.to_numeric(overall, errors="coerce").astype(float)
+
+    numbers = text.str.extractall(SCORE_RE)[0].astype(float)
+    if numbers.empty:
+        return pd.DataFrame({"overall_score": overall, "component_score": np.nan}, index=scores.index)
+
+    row = numbers.index.get_level_values(0)
+    is_overall = pd.Series(numbers.values == overall.loc[row].values, index=numbers.index)
+    first_overall = is_overall & (is_overall.groupby(level=0).cumsum() == 1)
+    component = numbers[~first_overall].groupby(level=0).min().reindex(scores.index)
+    return pd.DataFrame({"overall_score": overall, "component_score": component}, index=scores.index)
+
+
+def language_requirements_frame(courses: Iterable[dict]) -> pd.DataFrame:
+    """Returns one row per language requirement of the courses, keyed by course link and qualification."""
+    rows = []
+    for course in courses:
+        for requirement in course.get("language_requirements") or []:
+            rows.append({"link": course.get("link"), "qualification": course.get("qualification"),
+                         **{k: requirement.get(k) for k in LANGUAGE_REQUIREMENT_ATTRS}})
+    return pd.DataFrame(rows, columns=["link", "qualification"] + LANGUAGE_REQUIREMENT_ATTRS)
+
+
+def normalize_language_requirements(requirements_df: pd.DataFrame) -> pd.DataFrame:
+    """Adds canonical test_name, overall_score and component_score columns next to the raw requirement text."""
+    return pd.concat([requirements_df,
+                      normalize_language_tests(requirements_df["test"]).rename("test_name"),
+                      normalize_language_scores(requirements_df["score"])], axis=1)
+
+
+class LanguageScoreIndex(object):
+    """Range lookups of courses by English test and score.
+
+    The normalized requirements are sorted by (test_name, overall_score) once, so
+    `courses_accepting("IELTS", 6.5)` is a binary search for the test and the score
+    instead of a scan over every course.
+    """
+
+    def __init__(self, requirements_df: pd.DataFrame):
+        # requirements without a recognised test can not be looked up, and NA does not sort
+        df = requirements_df[requirements_df["overall_score"].notna() & requirements_df["test_name"].notna()] \
+            .sort_values(by=["test_name", "overall_score"], kind="stable") \
+            .reset_index(drop=True)
+        self.df = df
+        self.tests = df["test_name"].to_numpy(dtype=object)
+        self.scores = df["overall_score"].to_numpy(dtype=float)
+
+    def _test_range(self, test: str) -> tuple:
+        return np.searchsorted(self.tests, test, side="left"), np.searchsorted(self.tests, test, side="right")
+
+    def requirements_between(self, test: str, min_score: float = -np.inf, max_score: float = np.inf) -> pd.DataFrame:
+        """Returns the requirements of a test whose overall score lies in [min_score, max_score]."""
+        start, end = self._test_range(test)
+        lo = start + np.searchsorted(self.scores[start:end], min_score, side="left")
+        hi = start + np.searchsorted(self.scores[start:end], max_score, side="right")
+        return self.df.iloc[lo:hi]
+
+    def courses_accepting(self, test: str, score: float, component_score: Optional[float] = None) -> pd.DataFrame:
+        """Returns the courses (link, qualification) whose minimum overall score, and component
+        minimum when component_score is given, is met by the applicant's scores."""
+        df = self.requirements_between(test, max_score=score)
+        if component_score is not None:
+            df = df[df["component_score"].isna() | (df["component_score"] <= component_score)]
+        return df[["link", "qualification"]].drop_duplicates().reset_index(drop=True)
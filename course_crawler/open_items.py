@@ -0,0 +1,134 @@
+import uuid
+from collections import deque
+
+from scrapy import signals
+from scrapy.http import Request
+from scrapy.exceptions import DontCloseSpider, NotConfigured
+
+from course_crawler.checkpoint import checkpoint_saving
+
+
+class OpenItemsMiddleware(object):
+    """Finishes the courses in progress before discovering more.
+
+    Spiders tag the requests which start a new course (e.g. the course pages of a course
+    list) with meta={'discovery': True}. Each released discovery request opens an item,
+    every request yielded while crawling it (modules, fees, sub-pages) inherits its
+    `open_item` id and is scheduled OPEN_ITEMS_COMPLETION_PRIORITY above its parent,
+    so it is sent before any new course. An item is open while any of its requests is
+    scheduled, downloading or being parsed. Once MAX_OPEN_ITEMS items are open, further
+    discovery requests wait in a backlog and are released as items complete, so the
+    number of half-built courses stays bounded.
+    """
+
+    def __init__(self, crawler, max_open_items: int, completion_priority: int):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.max_open_items = max_open_items
+        self.completion_priority = completion_priority
+
+        self.outstanding = {}
+        self.backlog = deque()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("OPEN_ITEMS_ENABLED"):
+            raise NotConfigured
+        middleware = cls(crawler, crawler.settings.getint("MAX_OPEN_ITEMS"),
+                         crawler.settings.getint("OPEN_ITEMS_COMPLETION_PRIORITY"))
+        crawler.signals.connect(middleware.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(middleware.request_dropped, signal=signals.request_dropped)
+        crawler.signals.connect(middleware.request_left_downloader, signal=signals.request_left_downloader)
+        crawler.signals.connect(middleware.response_received, signal=signals.response_received)
+        crawler.signals.connect(middleware.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(middleware.saved_requests, signal=checkpoint_saving)
+        return middleware
+
+    @property
+    def open_items(self) -> int:
+        return sum(1 for x in self.outstanding.values() if x > 0)
+
+    def _count(self, request: Request, n: int):
+        key = request.meta.get('open_item')
+        if key is None:
+            return
+        self.outstanding[key] = self.outstanding.get(key, 0) + n
+        if self.outstanding[key] <= 0:
+            del self.outstanding[key]
+
+    def request_scheduled(self, request, spider):
+        self._count(request, 1)
+
+    def request_dropped(self, request, spider):
+        self._count(request, -1)
+
+    def request_left_downloader(self, request, spider):
+        self._count(request, -1)
+
+    def response_received(self, response, request, spider):
+        # held until the callback output is processed, see _response_done
+        self._count(request, 1)
+
+    def _response_done(self, response):
+        self._count(response.request, -1)
+
+    def _is_discovery(self, request: Request) -> bool:
+        return bool(request.meta.get('discovery')) and 'open_item' not in request.meta
+
+    def _release(self, spider):
+        open_items = self.open_items
+        while self.backlog and open_items < self.max_open_items:
+            request = self.backlog.popleft()
+            request.meta['open_item'] = uuid.uuid4().hex
+            open_items += 1
+            self.stats.inc_value("open_items/opened", spider=spider)
+            self.stats.max_value("open_items/max_open", open_items, spider=spider)
+            yield request
+
+    def _process(self, output, response, spider):
+        if not isinstance(output, Request):
+            return [output]
+        if self._is_discovery(output):
+            self.backlog.append(output)
+            self.stats.max_value("open_items/max_backlog", len(self.backlog), spider=spider)
+            return list(self._release(spider))
+
+        parent = response.request if response is not None else None
+        if parent is not None and 'open_item' in parent.meta and 'open_item' not in output.meta:
+            output.meta['open_item'] = parent.meta['open_item']
+        if parent is not None and 'open_item' in output.meta:
+            output.priority = max(output.priority, parent.priority + self.completion_priority)
+        return [output]
+
+    def process_start_requests(self, start_requests, spider):
+        for request in start_requests:
+            yield from self._process(request, None, spider)
+
+    def process_spider_output(self, response, result, spider):
+        for output in result:
+            yield from self._process(output, response, spider)
+        self._response_done(response)
+        yield from self._release(spider)
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for output in result:
+            for x in self._process(output, response, spider):
+                yield x
+        self._response_done(response)
+        for x in self._release(spider):
+            yield x
+
+    def process_spider_exception(self, response, exception, spider):
+        self._response_done(response)
+
+    def spider_idle(self, spider):
+        # nothing is scheduled, downloading or parsed, so no item is open anymore
+        self.outstanding.clear()
+        released = list(self._release(spider))
+        for request in released:
+            self.crawler.engine.crawl(request)
+        if released:
+            raise DontCloseSpider
+
+    def saved_requests(self, spider):
+        return list(self.backlog)
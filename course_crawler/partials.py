@@ -0,0 +1,127 @@
+import uuid
+import pickle
+import sqlite3
+import logging
+from pathlib import Path
+from collections import OrderedDict
+from typing import Optional
+
+from scrapy import signals
+
+from course_crawler.checkpoint import checkpoint_saving
+from course_crawler.sharding import shard_name
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS partials (
+    id TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class PartialItemStore(object):
+    """Courses being built across several requests, so that requests carry an item id
+    instead of the partial item itself.
+
+    The `max_items` most recently used items are kept in memory, older ones are
+    pickled to a SQLite database and loaded back when their next page arrives. The
+    items in memory are written to the database before every crawl checkpoint, the
+    database is removed once the spider finishes. Items are copies once spilled, so
+    an item which was changed has to be `put` back.
+
+        item_id = self.partials.new_id()
+        self.partials.put(item_id, item)
+        yield scrapy.Request(modules_link, callback=self.parse_modules, meta={'item_id': item_id})
+    """
+
+    def __init__(self, path: Path, max_items: int, stats=None):
+        self.path = path
+        self.max_items = max_items
+        self.stats = stats
+        self.items = OrderedDict()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path))
+        self.conn.executescript(SCHEMA)
+        self.spilled = 0
+
+    @classmethod
+    def from_crawler(cls, crawler, spider) -> 'PartialItemStore':
+        store = cls(Path(crawler.settings.get("PARTIAL_ITEMS_URI") % {"name": shard_name(spider)}),
+                    crawler.settings.getint("PARTIAL_ITEMS_IN_MEMORY"), crawler.stats)
+        crawler.signals.connect(store.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(store.checkpoint_saving, signal=checkpoint_saving)
+        return store
+
+    @staticmethod
+    def new_id() -> str:
+        """Returns the id of a new item, unique even when the same course page is requested twice."""
+        return uuid.uuid4().hex
+
+    def missing(self, item_id: str, request, spider):
+        """Logs a request whose partial item is missing, e.g. already completed, its course is dropped."""
+        if self.stats:
+            self.stats.inc_value("partial_items/missing", spider=spider)
+        logger.warning("Partial item %(item_id)s of %(request)s is missing, its course is dropped",
+                       {"item_id": item_id, "request": request}, extra={"spider": spider})
+
+    def put(self, item_id: str, item: dict):
+        self.items[item_id] = item
+        self.items.move_to_end(item_id)
+        while len(self.items) > self.max_items:
+            spilled_id, spilled_item = self.items.popitem(last=False)
+            self._write(spilled_id, spilled_item)
+            self.spilled += 1
+
+    def get(self, item_id: str) -> Optional[dict]:
+        if item_id in self.items:
+            self.items.move_to_end(item_id)
+            return self.items[item_id]
+
+        row = self.conn.execute("SELECT data FROM partials WHERE id = ?", (item_id,)).fetchone()
+        if row is None:
+            return None
+        item = pickle.loads(row[0])
+        self.put(item_id, item)
+        return item
+
+    def pop(self, item_id: str) -> Optional[dict]:
+        item = self.get(item_id)
+        self.items.pop(item_id, None)
+        self.conn.execute("DELETE FROM partials WHERE id = ?", (item_id,))
+        return item
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self.items or \
+            self.conn.execute("SELECT 1 FROM partials WHERE id = ?", (item_id,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        on_disk = self.conn.execute("SELECT id FROM partials").fetchall()
+        return len(self.items.keys() | {x[0] for x in on_disk})
+
+    def _write(self, item_id: str, item: dict):
+        self.conn.execute("INSERT OR REPLACE INTO partials (id, data) VALUES (?, ?)",
+                          (item_id, pickle.dumps(item, protocol=4)))
+
+    def flush(self):
+        if self.conn is None:
+            return
+        for item_id, item in self.items.items():
+            self._write(item_id, item)
+        self.conn.commit()
+
+    def checkpoint_saving(self, spider):
+        self.flush()
+
+    def spider_closed(self, spider, reason):
+        logger.info("%(spilled)d partial items were spilled to disk, %(left)d were never completed",
+                    {"spilled": self.spilled, "left": len(self)}, extra={"spider": spider})
+        if reason != "finished":
+            self.flush()
+        self.conn.close()
+        self.conn = None
+        if reason == "finished":
+            self.path.unlink(missing_ok=True)
@@ -3,18 +3,35 @@
 # Don"t forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 import os
+import sys
+import json
+import hashlib
 import logging
+import threading
+from pathlib import Path
+from collections import Counter
+from queue import Queue, Empty, Full
+from typing import Optional
 
 from functional import seq
+from twisted.internet import defer, reactor, threads
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.extensions.feedexport import FeedExporter
 from scrapy.utils.project import get_project_settings
 
 from course_crawler.items.course import Course, Location, Date, \
     LanguageRequirement, Module, Tuition
+from course_crawler.sharding import shard_suffix
+from course_crawler.snapshots import MANIFEST_NAME, course_digest, iter_courses, latest_snapshot, \
+    read_manifest, snapshot_entry, update_manifest
 
 
 ACADEMIC_YEAR = get_project_settings().get("ACADEMIC_YEAR")
 COURSE_SCHEMA_VERSION = get_project_settings().get("COURSE_SCHEMA_VERSION")
 
+logger = logging.getLogger(__name__)
+
 
 class SaveCourseToJSON(object):
 
@@ -65,3 +82,395 @@ class SaveCourseToJSON(object):
         })
 
         return course.dict()
+
+
+def _content_hash(value) -> str:
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _course_key(course: dict) -> tuple:
+    return course.get("link"), course.get("qualification")
+
+
+def _course_hashes(course: dict) -> tuple:
+    field_hashes = {field: _content_hash(value) for field, value in course.items()}
+    course_hash = _content_hash(sorted(field_hashes.items()))
+    return course_hash, field_hashes
+
+
+class SaveCourseDelta(object):
+    """Writes the added, removed and changed courses versus the previous snapshot.
+
+    Courses are identified by (link, qualification). The previous snapshot is reduced
+    to per-field content hashes when the spider opens, so only courses that differ
+    from it are kept in memory until the delta file is written on close.
+    """
+
+    def __init__(self, output_dir: str, delta_dir: str):
+        self.output_dir = output_dir
+        self.delta_dir = delta_dir
+
+        self.base_snapshot = None
+        self.previous = {}
+        self.candidates = {}
+        self.seen_keys = set()
+        self.unchanged_count = 0
+        self.replayed = Counter()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("COURSE_DELTA_ENABLED"):
+            raise NotConfigured
+        return cls(output_dir=crawler.settings.get("COURSE_OUTPUT_DIR"),
+                   delta_dir=crawler.settings.get("COURSE_DELTA_DIR"))
+
+    def _find_base_snapshot(self, spider) -> Optional[Path]:
+        directory = Path(self.output_dir, spider.name)
+        if Path(directory, MANIFEST_NAME).exists():
+            entry = latest_snapshot(self.output_dir, spider.name, exclude_timestamp=spider.timestamp)
+            return Path(entry["path"]) if entry else None
+
+        # output directories written before the feed manifests
+        snapshots = seq(directory.glob(f"courses_{spider.name}_*.json")) \
+            .filter(lambda x: spider.timestamp not in x.name) \
+            .filter(lambda x: x.stat().st_size > 0) \
+            .sorted(lambda x: x.name) \
+            .to_list()
+        return snapshots[-1] if snapshots else None
+
+    def open_spider(self, spider):
+        self.base_snapshot = self._find_base_snapshot(spider)
+        if self.base_snapshot is None:
+            logger.info("No previous snapshot for %s, every course is reported as added" % spider.name)
+        else:
+            try:
+                for course in iter_courses(str(self.base_snapshot)):
+                    self.previous.setdefault(_course_key(course), []).append(_course_hashes(course))
+            except json.decoder.JSONDecodeError:
+                logger.warning("Could not parse previous snapshot %s, every course is reported as added"
+                               % self.base_snapshot)
+                self.base_snapshot = None
+                self.previous = {}
+
+        if getattr(spider, "resumed", False):
+            self._replay_interrupted(spider)
+
+    def _replay_interrupted(self, spider):
+        """Counts the courses of the interrupted crawl which a resumed crawl continues, see CrawlCheckpoint."""
+        directory = Path(self.output_dir, spider.name)
+        entries = seq(read_manifest(str(directory))) \
+            .filter(lambda x: x["timestamp"] == spider.timestamp) \
+            .filter(lambda x: Path(x["file"]).suffix in (".json", ".jsonl")) \
+            .to_list()
+        if not entries:
+            return
+
+        count = 0
+        try:
+            for course in iter_courses(str(Path(directory, entries[0]["file"]))):
+                course_hash, field_hashes = _course_hashes(course)
+                self._add(course, course_hash, field_hashes)
+                self.replayed[course_hash] += 1
+                count += 1
+        except json.decoder.JSONDecodeError:
+            logger.warning("Snapshot %s is truncated after %d courses" % (entries[0]["file"], count))
+        logger.info("%d courses of the interrupted crawl added to the delta" % count)
+
+    def process_item(self, item, spider):
+        course_hash, field_hashes = _course_hashes(item)
+        if self.replayed[course_hash] > 0:
+            # scraped again by the resumed crawl, its request was in progress when it was interrupted
+            self.replayed[course_hash] -= 1
+            return item
+
+        self._add(item, course_hash, field_hashes)
+        return item
+
+    def _add(self, item, course_hash: str, field_hashes: dict):
+        key = _course_key(item)
+        self.seen_keys.add(key)
+
+        previous = self.previous.get(key, [])
+        for idx, (previous_hash, _) in enumerate(previous):
+            if previous_hash == course_hash:
+                previous.pop(idx)
+                self.unchanged_count += 1
+                return
+
+        self.candidates.setdefault(key, []).append((field_hashes, item))
+
+    def close_spider(self, spider):
+        added, changed, removed = [], [], []
+
+        for key, candidates in self.candidates.items():
+            previous = self.previous.get(key, [])
+            for idx, (field_hashes, item) in enumerate(candidates):
+                if idx >= len(previous):
+                    added.append(item)
+                    continue
+
+                _, previous_field_hashes = previous[idx]
+                changed_fields = seq(field_hashes.items()) \
+                    .filter(lambda x: previous_field_hashes.get(x[0]) != x[1]) \
+                    .map(lambda x: x[0]) \
+                    .to_list()
+                removed_fields = set(previous_field_hashes.keys()) - set(field_hashes.keys())
+                changed.append({
+                    "link": key[0],
+                    "qualification": key[1],
+                    "fields": {
+                        **{field: item[field] for field in changed_fields},
+                        **{field: None for field in removed_fields}
+                    }
+                })
+
+        for key, previous in self.previous.items():
+            matched = len(self.candidates.get(key, []))
+            for course_hash, _ in previous[matched:]:
+                removed.append({
+                    "link": key[0],
+                    "qualification": key[1],
+                    "hash": course_hash
+                })
+
+        delta = {
+            "university": spider.name,
+            "academic_year": ACADEMIC_YEAR,
+            "timestamp": spider.timestamp,
+            "base_snapshot": self.base_snapshot.name if self.base_snapshot else None,
+            "unchanged_count": self.unchanged_count,
+            "added": added,
+            "changed": changed,
+            "removed": removed
+        }
+
+        Path(self.delta_dir, spider.name).mkdir(parents=True, exist_ok=True)
+        delta_path = Path(self.delta_dir, spider.name,
+                          f"delta_{spider.name}_{ACADEMIC_YEAR}_{spider.timestamp}.json")
+        with open(delta_path, 'w', encoding='utf-8') as f:
+            json.dump(delta, f, ensure_ascii=False)
+
+        logger.info("Course delta (%d added, %d changed, %d removed) saved to path %s"
+                    % (len(added), len(changed), len(removed), delta_path))
+
+
+class BufferedCourseWriter(object):
+    """Writes validated courses as JSON lines from a background thread, in place of the JSON feeds.
+
+    Items are put into a bounded queue and serialized and written in batches of
+    BUFFERED_WRITER_BATCH_SIZE by a writer thread, so neither serialization nor a slow
+    disk stall the reactor. When the queue is full the returned Deferred holds the item
+    back until the writer took a batch, which keeps the response in the scraper and so
+    slows the crawl down. The JSON and JSON lines feeds of FEEDS are left out, the file
+    is added to the manifest of its directory once the spider closed, marked `partial`
+    unless it finished. A crawl resumed from a checkpoint appends to the file of the
+    interrupted one, skipping the courses which it already holds.
+    """
+
+    _STOP = object()
+
+    def __init__(self, uri: str, queue_size: int, batch_size: int, encoding: str, academic_year: str, stats=None):
+        self.uri = uri
+        self.batch_size = batch_size
+        self.encoding = encoding
+        self.academic_year = academic_year
+        self.stats = stats
+
+        self.queue = Queue(maxsize=queue_size)
+        self.waiting = []
+        self.thread = None
+        self.file = None
+        self.path = None
+        self.items_written = 0
+        self.resumed_count = 0
+        self.written = Counter()
+        self.error = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("BUFFERED_WRITER_ENABLED"):
+            raise NotConfigured
+        cls._disable_json_feeds(crawler)
+        writer = cls(uri=crawler.settings.get("BUFFERED_WRITER_URI"),
+                     queue_size=crawler.settings.getint("BUFFERED_WRITER_QUEUE_SIZE"),
+                     batch_size=crawler.settings.getint("BUFFERED_WRITER_BATCH_SIZE"),
+                     encoding=crawler.settings.get("FEED_EXPORT_ENCODING") or "utf-8",
+                     academic_year=crawler.settings.get("ACADEMIC_YEAR"),
+                     stats=crawler.stats)
+        # the close reason is only known once the item pipelines are closed
+        crawler.signals.connect(writer.spider_closed, signal=signals.spider_closed)
+        return writer
+
+    @staticmethod
+    def _disable_json_feeds(crawler):
+        # the feeds are opened with the spider, after the item pipelines are created
+        for extension in crawler.extensions.middlewares:
+            if not isinstance(extension, FeedExporter):
+                continue
+            for uri in [k for k, v in extension.feeds.items() if v.get("format") in ("json", "jsonlines")]:
+                del extension.feeds[uri]
+                logger.info("Feed %s is written by the buffered writer instead" % uri)
+
+    def open_spider(self, spider):
+        self.path = Path(self.uri % {"name": spider.name, "timestamp": spider.timestamp,
+                                     "shard": shard_suffix(spider)})
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if getattr(spider, "resumed", False) and self.path.exists():
+            with open(self.path, 'r', encoding=self.encoding) as f:
+                self.written = Counter(course_digest(json.loads(x)) for x in f if x.strip())
+            self.resumed_count = sum(self.written.values())
+            logger.info("Resuming %s after %d courses" % (self.path, self.resumed_count))
+        self.file = open(self.path, 'a', encoding=self.encoding)
+
+        self.thread = threading.Thread(target=self._write_batches, name=f"{spider.name}-writer", daemon=True)
+        self.thread.start()
+
+    def _write_batches(self):
+        stopped = False
+        while not stopped:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+
+            if batch[-1] is self._STOP:
+                batch.pop()
+                stopped = True
+            elif self.waiting:
+                reactor.callFromThread(self._release_waiting)
+
+            if self.error is None and batch:
+                try:
+                    self.file.write("".join(json.dumps(x, ensure_ascii=False) + "\n" for x in batch))
+                    self.file.flush()
+                    self.items_written += len(batch)
+                except (OSError, TypeError, ValueError) as e:
+                    self.error = e
+                    logger.error("Buffered writer failed writing to path %s: %s" % (self.path, e))
+
+        self.file.close()
+
+    def process_item(self, item, spider):
+        if self.written:
+            digest = course_digest(item)
+            if self.written[digest] > 0:
+                # scraped again by the resumed crawl, its request was in progress when it was interrupted
+                self.written[digest] -= 1
+                if self.stats:
+                    self.stats.inc_value("buffered_writer/resumed_duplicates", spider=spider)
+                return item
+
+        if not self.waiting:
+            try:
+                self.queue.put_nowait(item)
+                return item
+            except Full:
+                pass
+
+        if self.stats:
+            self.stats.inc_value("buffered_writer/backpressure_count", spider=spider)
+        d = defer.Deferred()
+        self.waiting.append((item, d))
+        # the writer may have emptied the queue before it could see the waiting item
+        if not self.queue.full():
+            self._release_waiting()
+        return d
+
+    def _release_waiting(self):
+        # called in the reactor thread, once the writer took a batch off the queue
+        while self.waiting:
+            item, d = self.waiting[0]
+            try:
+                self.queue.put_nowait(item)
+            except Full:
+                return
+            self.waiting.pop(0)
+            d.callback(item)
+
+    def close_spider(self, spider):
+        def _stop():
+            self.queue.put(self._STOP)
+            self.thread.join()
+
+            if self.stats:
+                self.stats.set_value("buffered_writer/items_written", self.items_written, spider=spider)
+            if self.error is not None:
+                raise self.error
+            logger.info("%d courses saved to path %s" % (self.items_written, self.path))
+
+        return threads.deferToThread(_stop)
+
+    def spider_closed(self, spider, reason):
+        return threads.deferToThread(self._add_to_manifest, spider, reason)
+
+    def _add_to_manifest(self, spider, reason):
+        partial = {"partial": True, "finish_reason": reason} if reason != "finished" else {}
+        entry = snapshot_entry(str(self.path), university=spider.name, academic_year=self.academic_year,
+                               timestamp=spider.timestamp, item_count=self.resumed_count + self.items_written,
+                               format="jsonlines", **partial)
+        update_manifest(str(self.path.parent), entry)
+
+
+class NormalizeReferenceTables(object):
+    """Stores repeated sub-object lists once and lets courses refer to them by id.
+
+    Each field listed in NORMALIZED_OUTPUT_FIELDS (language requirement sets and fee
+    tables by default) is replaced with a `<field>_ref` content hash id. Every distinct
+    table is kept once, with interned strings, and written to NORMALIZED_OUTPUT_URI
+    when the spider closes. Empty lists are referred to as None. Readers resolve the
+    ids through course_crawler.snapshots.ReferenceTables.
+    """
+
+    def __init__(self, uri: str, fields: list):
+        self.uri = uri
+        self.fields = fields
+        self.tables = {field: {} for field in fields}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("NORMALIZED_OUTPUT_ENABLED"):
+            raise NotConfigured
+        return cls(uri=crawler.settings.get("NORMALIZED_OUTPUT_URI"),
+                   fields=crawler.settings.getlist("NORMALIZED_OUTPUT_FIELDS"))
+
+    @staticmethod
+    def _intern(rows: list) -> list:
+        return seq(rows) \
+            .map(lambda x: {sys.intern(k): sys.intern(v) if isinstance(v, str) else v for k, v in x.items()}) \
+            .to_list()
+
+    def process_item(self, item, spider):
+        course = {k: v for k, v in item.items() if k not in self.fields}
+        for field in self.fields:
+            rows = item.get(field)
+            if not rows:
+                course[f"{field}_ref"] = None
+                continue
+
+            ref = _content_hash(rows)
+            if ref not in self.tables[field]:
+                self.tables[field][ref] = self._intern(rows)
+            course[f"{field}_ref"] = ref
+        return course
+
+    def _path(self, spider) -> Path:
+        return Path(self.uri % {"name": spider.name, "timestamp": spider.timestamp, "shard": shard_suffix(spider)})
+
+    def open_spider(self, spider):
+        # the courses of the interrupted crawl refer to its tables
+        path = self._path(spider)
+        if getattr(spider, "resumed", False) and path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                self.tables.update(json.load(f))
+
+    def close_spider(self, spider):
+        path = self._path(spider)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.tables, f, ensure_ascii=False)
+
+        logger.info("Reference tables (%s) saved to path %s"
+                    % (", ".join("%d %s" % (len(v), k) for k, v in self.tables.items()), path))
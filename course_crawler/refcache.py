@@ -0,0 +1,75 @@
+import os
+import time
+import pickle
+import hashlib
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceCache(object):
+    """Parsed reference tables (fees, language tests, module catalogues) of a spider kept across runs.
+
+    The tables are pickled to `<directory>/<spider>_<sources hash>.pickle`, keyed by the
+    spider and the URLs they were parsed from, and are loaded instead of fetched again
+    while they are younger than `ttl` seconds. `refresh` ignores the cached tables.
+    """
+
+    def __init__(self, directory: str, ttl: float, refresh: bool = False):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.refresh = refresh
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional['ReferenceCache']:
+        if not settings.getbool("REFERENCE_CACHE_ENABLED"):
+            return None
+        return cls(settings.get("REFERENCE_CACHE_DIR"), settings.getfloat("REFERENCE_CACHE_TTL"),
+                   settings.getbool("REFERENCE_CACHE_REFRESH"))
+
+    def path(self, spider_name: str, sources: List[str]) -> Path:
+        key = hashlib.sha1("\n".join(sorted(sources)).encode("utf-8")).hexdigest()[:12]
+        return self.directory / f"{spider_name}_{key}.pickle"
+
+    def load(self, spider_name: str, sources: List[str]) -> Optional[dict]:
+        """Returns the cached tables by attribute name, None when missing, expired or refreshed."""
+        path = self.path(spider_name, sources)
+        if self.refresh or not path.exists():
+            return None
+
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            logger.warning("Reference cache %s can not be read: %s" % (path, e))
+            return None
+
+        age = time.time() - entry["saved"]
+        if age > self.ttl:
+            logger.info("Reference cache %s expired %.1f days ago" % (path, (age - self.ttl) / 86400))
+            return None
+        return entry["attributes"]
+
+    def save(self, spider_name: str, sources: List[str], attributes: dict) -> bool:
+        """Caches the tables by attribute name, returns False when one of them is empty and the cache is left as is.
+
+        An empty table (e.g. the fees page changed its layout) would otherwise be reused for the whole TTL.
+        """
+        path = self.path(spider_name, sources)
+        empty = [k for k, v in attributes.items() if not v]
+        if empty:
+            logger.warning("Reference tables %s are empty, the reference cache %s is not updated"
+                           % (", ".join(empty), path))
+            return False
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {"spider": spider_name, "sources": sorted(sources), "saved": time.time(), "attributes": attributes}
+
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entry, f, protocol=4)
+        os.replace(tmp_path, path)
+        return True
@@ -0,0 +1,57 @@
+import os
+import sys
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+from scrapy.crawler import Crawler, CrawlerProcess
+from scrapy.utils.project import get_project_settings
+
+
+logger = logging.getLogger(__name__)
+
+# output paths in the settings (e.g. FEEDS) are relative to the spiders directory
+SPIDERS_DIR = Path(__file__).resolve().parent / "spiders"
+
+
+def concurrency_budget(spidercls, settings, spider_count: int) -> int:
+    """Returns the CONCURRENT_REQUESTS of a spider sharing RUN_CONCURRENT_REQUESTS with spider_count spiders."""
+    own_budget = (spidercls.custom_settings or {}).get("CONCURRENT_REQUESTS",
+                                                       settings.getint("CONCURRENT_REQUESTS"))
+    return max(min(int(own_budget), settings.getint("RUN_CONCURRENT_REQUESTS") // spider_count), 1)
+
+
+def run(spider_names: Optional[List[str]] = None):
+    """Runs the given spiders, or every registered spider but RUN_EXCLUDED_SPIDERS, on one reactor."""
+    os.chdir(SPIDERS_DIR)
+    settings = get_project_settings()
+    process = CrawlerProcess(settings)
+
+    spider_names = spider_names or [x for x in process.spider_loader.list()
+                                    if x not in settings.getlist("RUN_EXCLUDED_SPIDERS")]
+    crawlers = []
+    for name in spider_names:
+        spidercls = process.spider_loader.load(name)
+        crawler_settings = settings.copy()
+        crawler_settings.set("CONCURRENT_REQUESTS", concurrency_budget(spidercls, settings, len(spider_names)),
+                             priority="cmdline")
+
+        crawler = Crawler(spidercls, crawler_settings, init_reactor=not crawlers)
+        process.crawl(crawler)
+        crawlers.append(crawler)
+        logger.info("Scheduled spider %s with CONCURRENT_REQUESTS=%d"
+                    % (name, crawler.settings.getint("CONCURRENT_REQUESTS")))
+
+    process.start()
+
+    for crawler in crawlers:
+        logger.info("Spider %s finished (%s) with %d courses"
+                    % (crawler.spidercls.name, crawler.stats.get_value("finish_reason"),
+                       crawler.stats.get_value("item_scraped_count", 0)))
+
+
+if __name__ == "__main__":
+    # python -m course_crawler.run [<spider> ...]
+    sys.path.append(str(SPIDERS_DIR.parent.parent))
+
+    run(sys.argv[1:])
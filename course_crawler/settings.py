@@ -14,11 +14,14 @@ ACADEMIC_YEAR = "2024-2025"
 COURSE_SCHEMA_VERSION = "2024-01-05"
 
 FEEDS = {
-    f"../data/courses/output/%(name)s/courses_%(name)s_{ACADEMIC_YEAR}_%(timestamp)s.json": {
+    f"../data/courses/output/%(name)s/courses_%(name)s_{ACADEMIC_YEAR}_%(timestamp)s%(shard)s.json": {
         "format": "json"
     }
 }
 
+# %(shard)s is empty, or e.g. _shard0of4 for a spider run with -a shard=0 -a shards=4
+FEED_URI_PARAMS = 'course_crawler.sharding.feed_uri_params'
+
 BOT_NAME = 'course_crawler'
 
 SPIDER_MODULES = ['course_crawler.spiders']
@@ -29,6 +32,24 @@ NEWSPIDER_MODULE = 'course_crawler.spiders'
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/98.0.4758.82 ' \
              'Safari/537.36'
 
+# Stream s3:// feeds as multipart uploads, e.g. add to FEEDS
+# "s3://<bucket>/courses/%(name)s/courses_%(name)s_<ACADEMIC_YEAR>_%(timestamp)s%(shard)s.json": {"format": "json"}
+# Set AWS_ENDPOINT_URL to use an S3-compatible store such as MinIO
+# Local feeds are recorded in a manifest.json per output directory
+FEED_STORAGES = {
+    '': 'course_crawler.feedstorages.ManifestFileFeedStorage',
+    'file': 'course_crawler.feedstorages.ManifestFileFeedStorage',
+    's3': 'course_crawler.feedstorages.S3MultipartFeedStorage'
+}
+FEED_STORAGE_S3_PART_SIZE = 8 * 1024 * 1024
+FEED_STORAGE_S3_MAX_PENDING_PARTS = 4
+
+# Per-university Excel workbooks with one sheet per table, e.g. add to FEEDS
+# "../data/courses/excel/%(name)s/courses_%(name)s_<ACADEMIC_YEAR>_%(timestamp)s%(shard)s.xlsx": {"format": "xlsx"}
+FEED_EXPORTERS = {
+    'xlsx': 'course_crawler.exporters.CourseExcelItemExporter'
+}
+
 # Output encoding
 FEED_EXPORT_ENCODING = 'utf-8'
 FEED_FORMAT = 'json'
@@ -39,6 +60,34 @@ ROBOTSTXT_OBEY = False
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
 CONCURRENT_REQUESTS = 16
 
+# Share one crawl between several nodes (machines or processes) through a frontier database
+# holding the pending requests and request fingerprints, enable with
+# SCHEDULER = 'course_crawler.frontier.FrontierScheduler'
+# DUPEFILTER_CLASS = 'course_crawler.frontier.FrontierDupeFilter'
+# FRONTIER_NODE_ID defaults to <hostname>-<pid>, an idle node waits for nodes seen within FRONTIER_IDLE_TIMEOUT seconds
+# The frontier is cleared once a crawl finished, the next run continues an interrupted crawl
+FRONTIER_URI = "../data/frontier/%(name)s.sqlite"
+FRONTIER_NODE_ID = None
+FRONTIER_IDLE_TIMEOUT = 60.0
+
+# python -m course_crawler.run runs all spiders but these on one reactor, sharing a global cap of
+# RUN_CONCURRENT_REQUESTS, each gets min(its CONCURRENT_REQUESTS, RUN_CONCURRENT_REQUESTS // spiders)
+RUN_EXCLUDED_SPIDERS = ['example']
+RUN_CONCURRENT_REQUESTS = 64
+
+# Courses built across several requests are kept in a partial item store by id instead of in request meta,
+# the PARTIAL_ITEMS_IN_MEMORY most recently used in memory and the others in a SQLite database at PARTIAL_ITEMS_URI
+PARTIAL_ITEMS_URI = "../data/partials/%(name)s.sqlite"
+PARTIAL_ITEMS_IN_MEMORY = 200
+
+# Reference tables (fees, language tests, module catalogues) listed in a spider's `reference_attributes`
+# are cached in REFERENCE_CACHE_DIR and loaded instead of fetched while younger than REFERENCE_CACHE_TTL
+# seconds, force fetching them with -s REFERENCE_CACHE_REFRESH=True
+REFERENCE_CACHE_ENABLED = True
+REFERENCE_CACHE_DIR = "../data/cache/reference"
+REFERENCE_CACHE_TTL = 30 * 24 * 60 * 60
+REFERENCE_CACHE_REFRESH = False
+
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
 # See also autothrottle settings and docs
@@ -64,6 +113,29 @@ DOWNLOAD_DELAY = 1
 #SPIDER_MIDDLEWARES = {
 #    'course_crawler.middlewares.CourseCrawlerSpiderMiddleware': 543,
 #}
+SPIDER_MIDDLEWARES = {
+    'course_crawler.open_items.OpenItemsMiddleware': 450,
+    'course_crawler.sharding.ShardMiddleware': 500,
+    'course_crawler.checkpoint.CrawlCheckpoint': 950
+}
+
+# Requests completing a course in progress (modules, fees, sub-pages) are scheduled OPEN_ITEMS_COMPLETION_PRIORITY
+# above their parent, before requests which discover new courses (tagged with meta={'discovery': True}).
+# At most MAX_OPEN_ITEMS courses are in progress, further discovery requests wait until one completes
+OPEN_ITEMS_ENABLED = True
+MAX_OPEN_ITEMS = 64
+OPEN_ITEMS_COMPLETION_PRIORITY = 10
+
+# Save the pending requests, seen fingerprints and the spider's `checkpoint_attributes` to CHECKPOINT_URI
+# every CHECKPOINT_INTERVAL seconds, a crawl which did not finish resumes from its checkpoint on the next
+# run (start over with CHECKPOINT_RESUME = False). Checkpoints older than CHECKPOINT_MAX_AGE seconds are
+# ignored, crawls closed for one of CHECKPOINT_DISCARD_REASONS leave no checkpoint
+CHECKPOINT_ENABLED = True
+CHECKPOINT_URI = "../data/checkpoints/%(name)s.pickle"
+CHECKPOINT_INTERVAL = 60.0
+CHECKPOINT_RESUME = True
+CHECKPOINT_MAX_AGE = 2 * 24 * 3600
+CHECKPOINT_DISCARD_REASONS = ["extraction_quality_collapse"]
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
@@ -78,14 +150,70 @@ DOWNLOAD_DELAY = 1
 #EXTENSIONS = {
 #    'scrapy.extensions.telnet.TelnetConsole': None,
 #}
+EXTENSIONS = {
+    'course_crawler.extensions.FieldCoverageStats': 500,
+    'course_crawler.extensions.ExtractionQualityGate': 510,
+    'course_crawler.extensions.StatsDump': 520
+}
+
+# Running per-field fill counts in the crawl stats, logged every COVERAGE_LOG_INTERVAL seconds
+COVERAGE_STATS_ENABLED = True
+COVERAGE_LOG_INTERVAL = 60.0
+
+# Close the spider (reason "extraction_quality_collapse") when the fill rate of a key field
+# over the last QUALITY_GATE_WINDOW courses falls below its minimum, checked after QUALITY_GATE_WARMUP courses
+QUALITY_GATE_ENABLED = True
+QUALITY_GATE_WARMUP = 50
+QUALITY_GATE_WINDOW = 100
+QUALITY_GATE_THRESHOLDS = {
+    'title': 0.9,
+    'qualification': 0.5,
+    'tuitions': 0.1,
+    'start_dates': 0.1
+}
+
+# Dump the crawl stats as JSON (e.g. "../data/stats/%(name)s.json") every STATS_DUMP_INTERVAL seconds and on close
+STATS_DUMP_URI = None
+STATS_DUMP_INTERVAL = 30.0
+
+# python -m course_crawler.supervisor runs one `scrapy crawl` worker process per spider, at most
+# SUPERVISOR_WORKERS (default: number of cores) at a time. A worker which crashes, or whose response and item
+# counts do not change for SUPERVISOR_STALL_TIMEOUT seconds, is restarted up to SUPERVISOR_MAX_RESTARTS times.
+# Logs, stats and the merged run manifest are written to SUPERVISOR_RUNS_DIR/<run id>/
+SUPERVISOR_WORKERS = None
+SUPERVISOR_MAX_RESTARTS = 2
+SUPERVISOR_STALL_TIMEOUT = 900
+SUPERVISOR_POLL_INTERVAL = 5.0
+SUPERVISOR_RUNS_DIR = "../data/runs"
 LOG_LEVEL = 'ERROR'
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 ITEM_PIPELINES = {
-   'course_crawler.pipelines.SaveCourseToJSON': 200
+   'course_crawler.pipelines.SaveCourseToJSON': 200,
+   'course_crawler.pipelines.SaveCourseDelta': 300,
+   'course_crawler.pipelines.NormalizeReferenceTables': 400,
+   'course_crawler.pipelines.BufferedCourseWriter': 900
 }
 
+# Delta of added, changed and removed courses versus the previous snapshot
+COURSE_OUTPUT_DIR = "../data/courses/output"
+COURSE_DELTA_DIR = "../data/courses/delta"
+COURSE_DELTA_ENABLED = True
+
+# Normalized output layout, repeated sub-object lists are replaced with `<field>_ref` ids
+# into a reference tables file written next to the courses, snapshots.iter_courses resolves them
+# from the file named like the snapshot with references_ instead of courses_
+NORMALIZED_OUTPUT_ENABLED = False
+NORMALIZED_OUTPUT_FIELDS = ['language_requirements', 'tuitions']
+NORMALIZED_OUTPUT_URI = f"../data/courses/output/%(name)s/references_%(name)s_{ACADEMIC_YEAR}_%(timestamp)s%(shard)s.json"
+
+# JSON lines output written in batches from a background thread, replaces the JSON and JSON lines FEEDS
+BUFFERED_WRITER_ENABLED = False
+BUFFERED_WRITER_URI = f"../data/courses/output/%(name)s/courses_%(name)s_{ACADEMIC_YEAR}_%(timestamp)s%(shard)s.jsonl"
+BUFFERED_WRITER_QUEUE_SIZE = 1000
+BUFFERED_WRITER_BATCH_SIZE = 200
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
 #AUTOTHROTTLE_ENABLED = True
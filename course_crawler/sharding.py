@@ -0,0 +1,110 @@
+import hashlib
+import logging
+from typing import Tuple
+
+from scrapy import signals
+from scrapy.http import Request
+
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(key: str, shards: int) -> int:
+    """Returns the shard (0 to shards - 1) of a course URL or code, the same in every process."""
+    digest = hashlib.sha1(str(key).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % shards
+
+
+def supports_shards(spidercls) -> bool:
+    """True when a spider (class) tags its course requests with meta={'discovery': True}, see ShardMiddleware."""
+    return bool(getattr(spidercls, "shardable", False))
+
+
+def spider_shard(spider) -> Tuple[int, int]:
+    """Returns (shard, shards) of a spider run with `-a shard=<i> -a shards=<K>`, (0, 1) when not sharded."""
+    shards = int(getattr(spider, "shards", 1) or 1)
+    shard = int(getattr(spider, "shard", 0) or 0)
+    if shards < 1 or not 0 <= shard < shards:
+        raise ValueError(f"Invalid shard {shard} of {shards} shards")
+    if shards > 1 and not supports_shards(spider):
+        raise ValueError(f"Spider {spider.name} does not support shards, "
+                         f"set shardable = True once it tags its course requests with meta={{'discovery': True}}")
+    return shard, shards
+
+
+def in_shard(spider, key: str) -> bool:
+    """True when the course with the given URL or code is crawled by this shard of the spider."""
+    shard, shards = spider_shard(spider)
+    return shards == 1 or shard_of(key, shards) == shard
+
+
+def shard_suffix(spider) -> str:
+    """Returns `_shard<i>of<K>` for a sharded spider, an empty string otherwise."""
+    shard, shards = spider_shard(spider)
+    return f"_shard{shard}of{shards}" if shards > 1 else ""
+
+
+def shard_name(spider) -> str:
+    """Names the files of one shard of a spider (checkpoints, partial items), e.g. `cambridge_shard0of4`."""
+    return spider.name + shard_suffix(spider)
+
+
+def feed_uri_params(params: dict, spider) -> dict:
+    """FEED_URI_PARAMS adding `%(shard)s`, the shard suffix of the feed file name."""
+    return {**params, "shard": shard_suffix(spider)}
+
+
+class ShardMiddleware(object):
+    """Splits the courses of a spider between K worker processes.
+
+    Run with `-a shard=<i> -a shards=<K>`, a spider declaring `shardable = True` drops
+    the requests which discover a course (tagged with meta={'discovery': True}) unless
+    the hash of their meta['shard_key'] (e.g. the course code) or URL falls into shard i.
+    The course lists and reference data are fetched by every shard. Each shard writes
+    its own feed, named with `%(shard)s`, see course_crawler.supervisor to merge them.
+    Other spiders refuse to start with shards, they would crawl every course in every shard.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        # fails before the crawl starts when the spider does not support shards
+        spider_shard(crawler.spider)
+        middleware = cls(crawler.stats)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        return middleware
+
+    def spider_opened(self, spider):
+        shard, shards = spider_shard(spider)
+        if shards > 1:
+            logger.info("Crawling shard %(shard)d of %(shards)d shards",
+                        {"shard": shard, "shards": shards}, extra={"spider": spider})
+
+    def _keep(self, output, spider) -> bool:
+        if not isinstance(output, Request) or not output.meta.get('discovery'):
+            return True
+        if spider_shard(spider)[1] == 1:
+            return True
+
+        if in_shard(spider, output.meta.get('shard_key', output.url)):
+            self.stats.inc_value("shard/kept_requests", spider=spider)
+            return True
+        self.stats.inc_value("shard/dropped_requests", spider=spider)
+        return False
+
+    def process_start_requests(self, start_requests, spider):
+        for request in start_requests:
+            if self._keep(request, spider):
+                yield request
+
+    def process_spider_output(self, response, result, spider):
+        for output in result:
+            if self._keep(output, spider):
+                yield output
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for output in result:
+            if self._keep(output, spider):
+                yield output
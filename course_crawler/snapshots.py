@@ -0,0 +1,305 @@
+import os
+import re
+import sys
+import json
+import mmap
+import codecs
+import hashlib
+import logging
+import threading
+from glob import glob
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from functional import seq
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_NAME_RE = re.compile(
+    r"courses_(?P<university>\w+?)_(?P<academic_year>\d{4}-\d{4})_(?P<timestamp>(?P<version>\d{4}-\d{2}-\d{2})T[\d:]+)"
+    r"(?:_shard(?P<shard>\d+of\d+))?")
+
+
+def parse_snapshot_name(path: str) -> Optional[dict]:
+    """Returns university, academic year, timestamp, version (date) and shard encoded in a snapshot filename."""
+    match = SNAPSHOT_NAME_RE.search(Path(path).name)
+    return match.groupdict() if match else None
+
+
+MANIFEST_NAME = "manifest.json"
+
+_manifest_lock = threading.Lock()
+
+
+def read_manifest(directory: str) -> List[dict]:
+    """Returns the snapshot entries of the manifest in an output directory, oldest first."""
+    try:
+        with open(Path(directory, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def update_manifest(directory: str, entry: dict):
+    """Adds or replaces (by file name) a snapshot entry in the manifest of an output directory.
+
+    The manifest is locked with `manifest.json.lock`, so that the processes of a sharded
+    crawl (see course_crawler.supervisor) do not overwrite each other's entries.
+    """
+    with _manifest_lock, open(Path(directory, MANIFEST_NAME + ".lock"), 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        entries = seq(read_manifest(directory)).filter(lambda x: x["file"] != entry["file"]).to_list()
+        entries = sorted(entries + [entry], key=lambda x: (x["timestamp"] or "", x["file"]))
+
+        manifest_path = Path(directory, MANIFEST_NAME)
+        tmp_path = manifest_path.with_name(MANIFEST_NAME + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, manifest_path)
+
+
+def snapshot_entry(path: str, university: Optional[str] = None, academic_year: Optional[str] = None,
+                   timestamp: Optional[str] = None, item_count: Optional[int] = None, **kwargs) -> dict:
+    """Describes a snapshot file for the manifest, unknown fields are taken from its name.
+
+    The feed of one shard of a crawl (see course_crawler.sharding) is marked with its `shard`.
+    """
+    name = parse_snapshot_name(path) or {}
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(chunk)
+
+    return {
+        "file": Path(path).name,
+        "university": university or name.get("university"),
+        "academic_year": academic_year or name.get("academic_year"),
+        "timestamp": timestamp or name.get("timestamp"),
+        "item_count": item_count,
+        "byte_size": Path(path).stat().st_size,
+        "sha256": sha256.hexdigest(),
+        **({"shard": name["shard"]} if name.get("shard") else {}),
+        **kwargs
+    }
+
+
+def backfill_manifest(directory: str) -> int:
+    """Adds the snapshots of an output directory which are missing from its manifest."""
+    known = seq(read_manifest(directory)).map(lambda x: x["file"]).to_set()
+    added = 0
+    for path in sorted(Path(directory).glob("courses_*")):
+        if path.name in known or path.suffix not in (".json", ".jsonl") or parse_snapshot_name(path) is None:
+            continue
+        try:
+            item_count = sum(1 for _ in iter_courses(str(path), fields=[]))
+        except json.decoder.JSONDecodeError:
+            item_count = None
+        update_manifest(directory, snapshot_entry(str(path), item_count=item_count))
+        added += 1
+    return added
+
+
+def query_snapshots(output_dir: str, university: Optional[str] = None,
+                    academic_year: Optional[str] = None) -> List[dict]:
+    """Returns the manifest entries of every university (or one) in an output directory, oldest first.
+
+    Every entry has the absolute `path` of its snapshot added.
+    """
+    directories = [Path(output_dir, university)] if university else sorted(Path(output_dir).glob("*"))
+    entries = []
+    for directory in directories:
+        entries += seq(read_manifest(str(directory))) \
+            .filter(lambda x: academic_year is None or x["academic_year"] == academic_year) \
+            .map(lambda x: {**x, "path": str(Path(directory, x["file"]).resolve())}) \
+            .to_list()
+    return sorted(entries, key=lambda x: (x["timestamp"] or "", x["file"]))
+
+
+def is_complete_snapshot(entry: dict) -> bool:
+    """True for a JSON or JSON lines snapshot of a whole crawl, False for other feed formats, shards and
+    partial snapshots of crawls which did not finish."""
+    return Path(entry["file"]).suffix in (".json", ".jsonl") and not entry.get("shard") and not entry.get("partial")
+
+
+def latest_snapshot(output_dir: str, university: str, academic_year: Optional[str] = None,
+                    exclude_timestamp: Optional[str] = None) -> Optional[dict]:
+    """Returns the manifest entry of the latest complete non-empty snapshot of a university.
+
+    Shards and partial snapshots of crawls which did not finish are left out.
+    """
+    entries = seq(query_snapshots(output_dir, university, academic_year)) \
+        .filter(lambda x: x["timestamp"] != exclude_timestamp) \
+        .filter(is_complete_snapshot) \
+        .filter(lambda x: x["byte_size"] > 0) \
+        .to_list()
+    return entries[-1] if entries else None
+
+
+def find_snapshot_entries(patterns: List[str]) -> List[dict]:
+    """Expands manifests, glob patterns and .txt lists (one path per line) into snapshot entries.
+
+    Snapshots found through a glob or a .txt list are described by the manifest next to them,
+    or by their name. Only complete JSON snapshots are returned, see is_complete_snapshot.
+    """
+    manifests = {}
+    entries = []
+    for pattern in patterns:
+        if pattern.endswith(".txt"):
+            with open(pattern, 'r') as f:
+                paths = seq(f.readlines()).map(lambda x: x.strip()).filter(lambda x: x).to_list()
+        else:
+            paths = sorted(glob(pattern))
+
+        for path in paths:
+            if Path(path).name == MANIFEST_NAME:
+                entries += seq(read_manifest(str(Path(path).parent))) \
+                    .map(lambda x: {**x, "path": str(Path(path).parent / x["file"])}) \
+                    .to_list()
+            elif parse_snapshot_name(path) is not None:
+                directory = str(Path(path).parent)
+                if directory not in manifests:
+                    manifests[directory] = {x["file"]: x for x in read_manifest(directory)}
+                entry = manifests[directory].get(Path(path).name) or \
+                    {"file": Path(path).name, **parse_snapshot_name(path)}
+                entries.append({**entry, "path": path})
+
+    for entry in entries:
+        entry.setdefault("version", (entry["timestamp"] or "")[:10])
+    return seq(entries).filter(is_complete_snapshot).distinct_by(lambda x: x["path"]).to_list()
+
+
+def find_snapshots(patterns: List[str]) -> List[str]:
+    """Expands manifests, glob patterns and .txt lists (one path per line) into snapshot paths."""
+    return seq(find_snapshot_entries(patterns)).map(lambda x: x["path"]).to_list()
+
+
+_WHITESPACE_RE = re.compile(r"[ \t\n\r,]*")
+
+_decoder = json.JSONDecoder()
+
+
+def _project(course: dict, fields: Optional[List[str]], flags: Optional[List[str]]) -> dict:
+    if fields is not None:
+        course = {k: course[k] for k in fields if k in course}
+    for k in flags or []:
+        if k in course:
+            course[k] = bool(course[k])
+    return course
+
+
+def iter_course_spans(path: str, chunk_size: int = 1 << 20) -> Iterator[Tuple[dict, int, int]]:
+    """Streams (course, byte offset, byte length) of a JSON array or JSONL snapshot.
+
+    The file is memory-mapped and decoded chunk by chunk, so only the course being
+    parsed is held in memory. Raises json.JSONDecodeError on malformed or truncated
+    snapshots.
+    """
+    with open(path, 'rb') as f:
+        if Path(path).stat().st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            utf8 = codecs.getincrementaldecoder("utf-8")()
+            buffer, pos, offset, read_size = "", 0, 0, chunk_size
+            # byte offset of buffer[pos], separators between courses are ASCII
+            position = 0
+            started = False
+
+            while True:
+                end = _WHITESPACE_RE.match(buffer, pos).end()
+                position += end - pos
+                pos = end
+                if not started and buffer[pos:pos + 1] == "[":
+                    pos += 1
+                    position += 1
+                    continue
+                if pos < len(buffer) and buffer[pos] == "]":
+                    break
+                if pos < len(buffer):
+                    started = True
+                    try:
+                        course, end = _decoder.raw_decode(buffer, pos)
+                    except json.JSONDecodeError:
+                        if offset >= len(mm):
+                            raise
+                        # the course spans the end of the buffer, read a larger chunk and retry
+                        read_size *= 2
+                    else:
+                        length = len(buffer[pos:end].encode("utf-8"))
+                        yield course, position, length
+                        pos, position, read_size = end, position + length, chunk_size
+                        continue
+                elif offset >= len(mm):
+                    break
+
+                chunk = mm[offset:offset + read_size]
+                offset += len(chunk)
+                buffer = buffer[pos:] + utf8.decode(chunk, final=offset >= len(mm))
+                pos = 0
+
+
+def references_path(path: str) -> Path:
+    """Returns the reference tables file of a normalized snapshot, `references_<...>.json` next to `courses_<...>`."""
+    path = Path(path)
+    return path.with_name("references_" + path.stem[len("courses_"):] + ".json")
+
+
+class ReferenceTables(object):
+    """The reference tables of a normalized snapshot, loaded the first time a course refers to them.
+
+    Courses written with NORMALIZED_OUTPUT_ENABLED (see pipelines.NormalizeReferenceTables)
+    hold a `<field>_ref` id instead of the field, `resolve` puts the field back.
+    """
+
+    def __init__(self, snapshot_path: str):
+        self.path = references_path(snapshot_path)
+        self.tables = None
+
+    def resolve(self, course: dict, fields: Optional[List[str]] = None) -> dict:
+        refs = [k for k in course if k.endswith("_ref") and (fields is None or k[:-len("_ref")] in fields)]
+        if not refs:
+            return course
+
+        if self.tables is None:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.tables = json.load(f)
+
+        course = dict(course)
+        for key in refs:
+            field, ref = key[:-len("_ref")], course.pop(key)
+            course[field] = self.tables[field][ref] if ref is not None else []
+        return course
+
+
+def iter_courses(path: str, fields: Optional[List[str]] = None, flags: Optional[List[str]] = None,
+                 chunk_size: int = 1 << 20) -> Iterator[dict]:
+    """Streams the courses of a JSON array or JSONL snapshot one at a time.
+
+    `fields` keeps only the given keys of every course and `flags` replaces the value
+    of the given keys with its truthiness, e.g. to test the large HTML fields without
+    keeping them. The fields of normalized snapshots are resolved from their reference
+    tables. Raises json.JSONDecodeError on malformed or truncated snapshots.
+    """
+    references = ReferenceTables(path)
+    for course, _, _ in iter_course_spans(path, chunk_size):
+        yield _project(references.resolve(course, fields), fields, flags)
+
+
+def course_digest(course: dict) -> str:
+    """Identifies a course by its content, e.g. to skip a course written twice by a resumed crawl."""
+    return hashlib.sha1(json.dumps(course, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+if __name__ == "__main__":
+    # python -m course_crawler.snapshots <output_dir>, adds existing snapshots to the manifests
+    logging.basicConfig(level=logging.INFO)
+
+    for directory in sorted(Path(sys.argv[1]).glob("*")):
+        if directory.is_dir():
+            logger.info("%d snapshots added to the manifest of %s" % (backfill_manifest(str(directory)), directory))
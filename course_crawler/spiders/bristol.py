@@ -23,8 +23,13 @@ from scrapy.utils.project import get_project_settings
 from scrapy.utils.reactor import install_reactor
 import requests
 
+sys.path.append(os.path.sep.join(os.getcwd().split(os.path.sep)[:-2]))
 
-class BristolSpider(scrapy.Spider):
+from course_crawler.bootstrap import BootstrapMixin  # noqa: E402
+from course_crawler.partials import PartialItemStore  # noqa: E402
+
+
+class BristolSpider(BootstrapMixin, scrapy.Spider):
 
     name = 'bristol'
     timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
@@ -37,6 +42,10 @@ class BristolSpider(scrapy.Spider):
     language_certificates = {}
     tuition_fees = {}
 
+    # reference tables cached across runs and restored when an interrupted crawl resumes
+    reference_attributes = ['tuition_fees', 'language_certificates']
+    checkpoint_attributes = BootstrapMixin.checkpoint_attributes + reference_attributes + ['unique_courses']
+
     start_urls = ["http://www.bristol.ac.uk/study/postgraduate/search/?filterStudyType=Taught&q="]
 
     # Overrides configuration values defined in course_crawler/settings.py
@@ -53,16 +62,24 @@ class BristolSpider(scrapy.Spider):
     def from_crawler(cls, crawler, *args, **kwargs):
         spider = super(BristolSpider, cls).from_crawler(crawler, *args, **kwargs)
         crawler.signals.connect(spider.spider_opened, signal=signals.spider_opened)
+        spider.partials = PartialItemStore.from_crawler(crawler, spider)
         return spider
 
     def spider_opened(self):
         Path(f"../data/courses/output/{self.name}").mkdir(parents=True, exist_ok=True)
 
-    def start_requests(self):
+    def bootstrap_requests(self):
         yield scrapy.Request(
             url='https://bristol.ac.uk/students/support/finances/tuition-fees/pgt/home/23-24/2023-starters/',
             callback=self.parse_tuitions,
             meta={'tuition_type': 'uk'})
+        yield scrapy.Request(
+            url='https://bristol.ac.uk/students/support/finances/tuition-fees/pgt/overseas/23-24/2023-starters/',
+            callback=self.parse_tuitions,
+            meta={'tuition_type': 'international'})
+        yield scrapy.Request(
+            url='https://www.bristol.ac.uk/study/language-requirements/',
+            callback=self.parse_english_language_requirement_list)
 
     def parse_tuitions(self, response: HtmlResponse):
         soup = BeautifulSoup(response.body, 'html.parser', from_encoding='utf-8')
@@ -77,16 +94,6 @@ class BristolSpider(scrapy.Spider):
             self.tuition_fees[tuition_type].append(
                 (programme.text, 'Part-time' if mode.text != 'FT' else 'Full-time', fee.text))
 
-        if len(self.tuition_fees.keys()) == 2:
-            yield scrapy.Request(
-                url='https://www.bristol.ac.uk/study/language-requirements/',
-                callback=self.parse_english_language_requirement_list)
-        else:
-            yield scrapy.Request(
-                url='https://bristol.ac.uk/students/support/finances/tuition-fees/pgt/overseas/23-24/2023-starters/',
-                callback=self.parse_tuitions,
-                meta={'tuition_type': 'international'})
-
     def parse_english_language_requirement_list(self, response: HtmlResponse):
         soup = BeautifulSoup(response.body, 'html.parser', from_encoding='utf-8')
 
@@ -118,12 +125,6 @@ class BristolSpider(scrapy.Spider):
 
         self.language_certificates[profile_level] = requirements
 
-        if len(self.language_certificates.keys()) == 8:
-            for url in self.start_urls:
-                yield scrapy.Request(
-                    url=url,
-                    callback=self.parse_course_list)
-
     def parse_course_list(self, response: HtmlResponse):
         soup = BeautifulSoup(response.body, 'html.parser', from_encoding='utf-8')
 
@@ -342,7 +343,10 @@ class BristolSpider(scrapy.Spider):
     def parse_modules(self, response: HtmlResponse):
         soup = BeautifulSoup(response.body, 'html.parser', from_encoding='utf-8')
 
-        item = response.meta['item']
+        item = self.partials.pop(response.meta['item_id'])
+        if item is None:
+            self.partials.missing(response.meta['item_id'], response.request, self)
+            return
 
         modules = self._get_modules(soup)
         item['modules'] = modules
@@ -392,11 +396,13 @@ class BristolSpider(scrapy.Spider):
         modules_link = self._get_modules_link(soup)
         if link != 'https://www.bristol.ac.uk/study/postgraduate/':
             if modules_link:
+                item_id = self.partials.new_id()
+                self.partials.put(item_id, item)
                 yield scrapy.Request(
                     url=modules_link,
                     callback=self.parse_modules,
                     dont_filter=True,
-                    meta={'item': item}
+                    meta={'item_id': item_id}
                 )
             else:
                 item['modules'] = []
@@ -413,7 +419,4 @@ def run():
 
 
 if __name__ == "__main__":
-    project_dir = os.path.sep.join(os.getcwd().split(os.path.sep)[:-2])
-    sys.path.append(project_dir)
-
     run()
\ No newline at end of file
@@ -19,6 +19,11 @@ from scrapy import signals
 from scrapy.http import HtmlResponse
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
+
+sys.path.append(os.path.sep.join(os.getcwd().split(os.path.sep)[:-2]))
+
+from course_crawler.sharding import in_shard  # noqa: E402
+
 BASEURL = 'https://www.postgraduate.study.cam.ac.uk'
 
 class CambridgeSpider(scrapy.Spider):
@@ -26,6 +31,8 @@ class CambridgeSpider(scrapy.Spider):
     timestamp = datetime.today().strftime('%Y-%m-%dT%H:%M:%S')
     university = 'University of Cambridge'
     study_level = 'Graduate'
+    # course requests are tagged with meta={'discovery': True}, see course_crawler.sharding
+    shardable = True
     entry_req = ""
     start_urls = [
         "https://2024.gaobase.admin.cam.ac.uk/api/courses.datatable?taught_research=taught"
@@ -86,6 +93,8 @@ class CambridgeSpider(scrapy.Spider):
                 yield scrapy.Request(url=prospectus_url, 
                                      callback=self.parse_ice_course, 
                                      meta={
+                                        'discovery': True,
+                                        'shard_key': course['code'],
                                         'code':course['code'],
                                         'title': course['title'],
                                         'full_time':course['full_time'],
@@ -95,6 +104,8 @@ class CambridgeSpider(scrapy.Spider):
                 yield scrapy.Request(url=prospectus_url, 
                                      callback=self.parse_pg_course,
                                      meta={
+                                        'discovery': True,
+                                        'shard_key': course['code'],
                                         'code':course['code'],
                                         'title': course['title'],
                                         'full_time':course['full_time'],
@@ -104,12 +115,14 @@ class CambridgeSpider(scrapy.Spider):
                 yield scrapy.Request(url=prospectus_url, 
                                      callback=self.parse_jbs_course,
                                      meta={
+                                        'discovery': True,
+                                        'shard_key': course['code'],
                                         'code':course['code'],
                                         'title': course['title'],
                                         'full_time':course['full_time'],
                                         'part_time': course['part_time'],
                                         'qualification':course['qualification']},dont_filter=True)
-            else:
+            elif in_shard(self, course['code']):
                 yield {
                     'link': course['prospectus_url'],
                     'title': course['title'],
@@ -662,7 +675,4 @@ def run():
 
 
 if __name__ == "__main__":
-    project_dir = os.path.sep.join(os.getcwd().split(os.path.sep)[:-2])
-    sys.path.append(project_dir)
-
     run()
@@ -19,6 +19,10 @@ from scrapy.http import HtmlResponse
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
 
+sys.path.append(os.path.sep.join(os.getcwd().split(os.path.sep)[:-2]))
+
+from course_crawler.partials import PartialItemStore  # noqa: E402
+
 
 class EdinburghSpider(scrapy.Spider):
 
@@ -28,6 +32,9 @@ class EdinburghSpider(scrapy.Spider):
     university = 'University of Edinburgh'
     study_level = 'Graduate'
 
+    # course requests are tagged with meta={'discovery': True}, see course_crawler.sharding
+    shardable = True
+
     start_urls = [
         'https://www.ed.ac.uk/studying/postgraduate/degrees/index.php?r=site/taught&edition=2023'
     ]
@@ -36,19 +43,27 @@ class EdinburghSpider(scrapy.Spider):
     def from_crawler(cls, crawler, *args, **kwargs):
         spider = super(EdinburghSpider, cls).from_crawler(crawler, *args, **kwargs)
         crawler.signals.connect(spider.spider_opened, signal=signals.spider_opened)
+        spider.partials = PartialItemStore.from_crawler(crawler, spider)
         return spider
 
     def spider_opened(self):
         Path(f"../data/courses/output/{self.name}").mkdir(parents=True, exist_ok=True)
 
     def call_next(self, response: HtmlResponse):
+        # the course and the pages left to visit are kept in the partial item store, requests carry its id
         meta = response.request.meta
-
-        if len(meta['callstack']) > 0:
-            target = meta['callstack'].pop(0)
-            yield scrapy.Request(target['url'], meta=meta | target['meta'], callback=target['callback'], errback=self.call_next)
+        partial = self.partials.get(meta['item_id'])
+        if partial is None:
+            self.partials.missing(meta['item_id'], response.request, self)
+            return
+
+        if len(partial['callstack']) > 0:
+            target = partial['callstack'].pop(0)
+            self.partials.put(meta['item_id'], partial)
+            yield scrapy.Request(target['url'], meta={'item_id': meta['item_id']} | target['meta'],
+                                 callback=getattr(self, target['callback']), errback=self.call_next)
         else:
-            yield meta['course']
+            yield self.partials.pop(meta['item_id'])['course']
 
     def start_requests(self):
         for url in self.start_urls:
@@ -65,7 +80,8 @@ class EdinburghSpider(scrapy.Spider):
         for title, url in course_list:
             yield scrapy.Request(url=url,
                                  callback=self.parse_course,
-                                 dont_filter=True)
+                                 dont_filter=True,
+                                 meta={'discovery': True})
 
     def _get_title(self, soup: BeautifulSoup) -> Optional[str]:
         try:
@@ -248,7 +264,12 @@ class EdinburghSpider(scrapy.Spider):
                     module_list.append({"type": type, "title": title, "link": link})
                 collect = False
 
-        response.meta['course']['modules'] = module_list
+        partial = self.partials.get(response.meta['item_id'])
+        if partial is None:
+            self.partials.missing(response.meta['item_id'], response.request, self)
+            return []
+        partial['course']['modules'] = module_list
+        self.partials.put(response.meta['item_id'], partial)
         return self.call_next(response)
 
     def parse_tuition(self, response: HtmlResponse):
@@ -283,10 +304,15 @@ class EdinburghSpider(scrapy.Spider):
         except (AttributeError, TypeError):
             tuition_list = []
 
-        if 'tuitions' not in response.meta['course']:
-            response.meta['course']['tuitions'] = tuition_list
+        partial = self.partials.get(response.meta['item_id'])
+        if partial is None:
+            self.partials.missing(response.meta['item_id'], response.request, self)
+            return []
+        if 'tuitions' not in partial['course']:
+            partial['course']['tuitions'] = tuition_list
         else:
-            response.meta['course']['tuitions'] += tuition_list
+            partial['course']['tuitions'] += tuition_list
+        self.partials.put(response.meta['item_id'], partial)
 
         return self.call_next(response)
 
@@ -329,7 +355,7 @@ class EdinburghSpider(scrapy.Spider):
         if module_link:
             callstack.append({
                 'url': module_link,
-                'callback': self.parse_modules,
+                'callback': 'parse_modules',
                 'meta': {}
             })
         else:
@@ -339,14 +365,16 @@ class EdinburghSpider(scrapy.Spider):
             for tuition_link in tuition_links:
                 callstack.append({
                     'url': tuition_link['link'],
-                    'callback': self.parse_tuition,
+                    'callback': 'parse_tuition',
                     'meta': {'study_mode': tuition_link['study_mode'], 'duration': tuition_link['duration']}
                 })
         else:
             course['tuitions'] = []
 
-        response.meta['course'] = course
-        response.meta['callstack'] = callstack
+        # course pages are requested with dont_filter=True, the same link may be parsed twice
+        item_id = self.partials.new_id()
+        self.partials.put(item_id, {'course': course, 'callstack': callstack})
+        response.meta['item_id'] = item_id
 
         return self.call_next(response)
 
@@ -358,7 +386,4 @@ def run():
 
 
 if __name__ == "__main__":
-    project_dir = os.path.sep.join(os.getcwd().split(os.path.sep)[:-2])
-    sys.path.append(project_dir)
-
     run()
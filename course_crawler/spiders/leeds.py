@@ -19,8 +19,12 @@ from scrapy.http import HtmlResponse
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
 
+sys.path.append(os.path.sep.join(os.getcwd().split(os.path.sep)[:-2]))
 
-class LeedsSpider(scrapy.Spider):
+from course_crawler.bootstrap import BootstrapMixin  # noqa: E402
+
+
+class LeedsSpider(BootstrapMixin, scrapy.Spider):
 
     name = 'leeds'
     timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
@@ -31,6 +35,10 @@ class LeedsSpider(scrapy.Spider):
     english_language_certificate_map = {}
     modules_link_map= {}
 
+    # reference tables cached across runs and restored when an interrupted crawl resumes
+    reference_attributes = ['english_language_certificate_map', 'modules_link_map']
+    checkpoint_attributes = BootstrapMixin.checkpoint_attributes + reference_attributes
+
     start_urls = [
         'https://courses.leeds.ac.uk/course-search/masters-courses?query=&type=PGT&page=1&term=202425',
         'https://courses.leeds.ac.uk/course-search/masters-courses?query=&type=PGT&page=2&term=202425',
@@ -64,7 +72,7 @@ class LeedsSpider(scrapy.Spider):
     def spider_opened(self):
         Path(f"../data/courses/output/{self.name}").mkdir(parents=True, exist_ok=True)
 
-    def start_requests(self):
+    def bootstrap_requests(self):
         # English language minimum requirements
         # IELTS (6.5 overall with no less than 6.0 in each component skill)
         # yield scrapy.Request(
@@ -82,17 +90,12 @@ class LeedsSpider(scrapy.Spider):
         yield scrapy.Request(
             url="https://webprod3.leeds.ac.uk/catalogue/modulesearch.asp?L=TP&Y=202425&E=all&N=all&S=+&A=any",
             callback=self.parse_module_links,
+            errback=self.errback,
             meta=dict(
                             playwright=True,
-                            playwright_include_page=True,
-                            errback=self.errback
+                            playwright_include_page=True
                             ))
 
-
-        for url in self.start_urls:
-            yield scrapy.Request(url=url,
-                                 callback=self.parse_course_list)
-
     # def parse_english_minimum_requirements(self, response: HtmlResponse):
     #     soup = BeautifulSoup(response.body, 'html.parser', from_encoding='utf-8')
     #     certificates = []
@@ -559,7 +562,4 @@ def run():
 
 
 if __name__ == "__main__":
-    project_dir = os.path.sep.join(os.getcwd().split(os.path.sep)[:-2])
-    sys.path.append(project_dir)
-
     run()
@@ -20,8 +20,12 @@ from scrapy.http import HtmlResponse
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
 
+sys.path.append(os.path.sep.join(os.getcwd().split(os.path.sep)[:-2]))
 
-class OxfordSpider(scrapy.Spider):
+from course_crawler.bootstrap import BootstrapMixin  # noqa: E402
+
+
+class OxfordSpider(BootstrapMixin, scrapy.Spider):
 
     name = 'oxford'
     timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
@@ -29,8 +33,15 @@ class OxfordSpider(scrapy.Spider):
     university = 'University of Oxford'
     study_level = 'Graduate'
 
+    # course requests are tagged with meta={'discovery': True}, see course_crawler.sharding
+    shardable = True
+
     language_certificates = {}
 
+    # reference tables cached across runs and restored when an interrupted crawl resumes
+    reference_attributes = ['language_certificates']
+    checkpoint_attributes = BootstrapMixin.checkpoint_attributes + reference_attributes
+
     start_urls = ["https://www.ox.ac.uk/admissions/graduate/courses/courses-a-z-listing?page=0",
                     "https://www.ox.ac.uk/admissions/graduate/courses/courses-a-z-listing?page=1",
                     "https://www.ox.ac.uk/admissions/graduate/courses/courses-a-z-listing?page=2",
@@ -46,7 +57,7 @@ class OxfordSpider(scrapy.Spider):
     def spider_opened(self):
         Path(f"../data/courses/output/{self.name}").mkdir(parents=True, exist_ok=True)
 
-    def start_requests(self):
+    def bootstrap_requests(self):
         yield scrapy.Request(url="https://www.ox.ac.uk/admissions/graduate/applying-to-oxford/application-guide/qualifications-experience-languages-funding/english-language-proficiency",
                              callback=self.parse_english_language_requirements)
 
@@ -73,10 +84,6 @@ class OxfordSpider(scrapy.Spider):
         self.language_certificates['Standard'] = _parse_table(soup.select('table')[0])
         self.language_certificates['Higher'] = _parse_table(soup.select('table')[0])
 
-        for url in self.start_urls:
-            yield scrapy.Request(url=url,
-                                 callback=self.parse_course_list)
-
     def parse_course_list(self, response: HtmlResponse):
         soup = BeautifulSoup(response.body, 'html.parser', from_encoding='utf-8')
 
@@ -95,6 +102,7 @@ class OxfordSpider(scrapy.Spider):
                                  callback=self.parse_course,
                                  dont_filter=True,
                                  meta={
+                                     'discovery': True,
                                      'title': title,
                                      'qualification': qualification,
                                      'location': location,
@@ -272,7 +280,4 @@ def run():
 
 
 if __name__ == "__main__":
-    project_dir = os.path.sep.join(os.getcwd().split(os.path.sep)[:-2])
-    sys.path.append(project_dir)
-
     run()
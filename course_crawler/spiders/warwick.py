@@ -19,8 +19,12 @@ from scrapy.http import HtmlResponse
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
 
+sys.path.append(os.path.sep.join(os.getcwd().split(os.path.sep)[:-2]))
 
-class WarwickSpider(scrapy.Spider):
+from course_crawler.bootstrap import BootstrapMixin  # noqa: E402
+
+
+class WarwickSpider(BootstrapMixin, scrapy.Spider):
 
     name = 'warwick'
     timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
@@ -33,6 +37,11 @@ class WarwickSpider(scrapy.Spider):
     research_fees = []
     default_application_dates=[]
 
+    # reference tables cached across runs and restored when an interrupted crawl resumes
+    reference_attributes = ['english_language_certificate_map', 'tuition_taught_course_fees_map', 'research_fees',
+                            'default_application_dates']
+    checkpoint_attributes = BootstrapMixin.checkpoint_attributes + reference_attributes
+
     start_urls = [
         'https://warwick.ac.uk/study/postgraduate/courses/'
     ]
@@ -46,15 +55,15 @@ class WarwickSpider(scrapy.Spider):
     def spider_opened(self):
         Path(f"../data/courses/output/{self.name}").mkdir(parents=True, exist_ok=True)
 
-    def start_requests(self):
+    def bootstrap_requests(self):
         # English language requirements
         yield scrapy.Request(
             url='https://warwick.ac.uk/study/postgraduate/apply/english/englishlanguagealternative/',
             callback=self.parse_warwick_english_requirements,
+            errback=self.errback,
             meta=dict(
                             playwright=True,
-                            playwright_include_page=True,
-                            errback=self.errback
+                            playwright_include_page=True
                             ))
 
         # Tuition taught course fees
@@ -74,10 +83,6 @@ class WarwickSpider(scrapy.Spider):
             callback=self.parse_application_dates
             )
 
-        for url in self.start_urls:
-            yield scrapy.Request(url=url,
-                                 callback=self.parse_course_list)
-
     def parse_warwick_tuition_fees(self, response: HtmlResponse):
         soup = BeautifulSoup(
                             response.body,
@@ -433,7 +438,4 @@ def run():
 
 
 if __name__ == "__main__":
-    project_dir = os.path.sep.join(os.getcwd().split(os.path.sep)[:-2])
-    sys.path.append(project_dir)
-
     run()
@@ -0,0 +1,153 @@
+import os
+import sys
+import json
+import logging
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(os.path.sep.join(os.getcwd().split(os.path.sep)[:-2]))
+
+from course_crawler.coverage import COMPLEX_ATTRS, NESTED_ATTRS  # noqa: E402
+from course_crawler.snapshots import find_snapshot_entries, iter_courses  # noqa: E402
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The last two snapshots of every university in these manifests are compared,
+# override with two snapshot paths (old, new) as command line arguments
+TARGET_MANIFESTS = ["../data/courses/output/*/manifest.json"]
+
+KEY = ["link", "qualification", "occurrence"]
+LIST_ATTRS = COMPLEX_ATTRS + list(NESTED_ATTRS.keys())
+IGNORED_ATTRS = ["schema_version", "academic_year"]
+
+TOP_CHANGED_COURSES = 20
+
+
+def _serialize(value) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def load_snapshot(path: str) -> pd.DataFrame:
+    """Returns one row per course keyed by link, qualification and occurrence.
+
+    Courses sharing link and qualification are aligned by the order they appear in.
+    """
+    df = pd.DataFrame(iter_courses(path))
+    if df.empty:
+        return pd.DataFrame(columns=KEY)
+
+    df = df.drop(columns=[x for x in IGNORED_ATTRS if x in df.columns])
+    for attr in ["link", "qualification"]:
+        if attr not in df.columns:
+            df[attr] = None
+    df["occurrence"] = df.groupby(["link", "qualification"], dropna=False).cumcount()
+    return df
+
+
+def _list_changes(old: pd.Series, new: pd.Series) -> pd.DataFrame:
+    """Returns the number of items added to and removed from the list attribute of every aligned course."""
+    def items(lists: pd.Series, side: str) -> pd.Series:
+        exploded = lists.explode().dropna()
+        return pd.DataFrame({"row": exploded.index, "item": exploded.map(_serialize).values}) \
+            .value_counts().rename(side)
+
+    counts = pd.concat([items(old, "old"), items(new, "new")], axis=1).fillna(0)
+    diff = counts["new"] - counts["old"]
+    changes = pd.DataFrame({"added": diff.clip(lower=0), "removed": (-diff).clip(lower=0)})
+    return changes.groupby(level="row").sum().reindex(old.index, fill_value=0).astype(int)
+
+
+def _side(aligned: pd.DataFrame, attr: str, suffix: str, side_df: pd.DataFrame) -> pd.Series:
+    if f"{attr}{suffix}" in aligned.columns:
+        return aligned[f"{attr}{suffix}"]
+    if attr in side_df.columns:
+        return aligned[attr]
+    return pd.Series(None, index=aligned.index, dtype=object)
+
+
+def field_drift(old_df: pd.DataFrame, new_df: pd.DataFrame) -> tuple:
+    """Compares two snapshots field by field.
+
+    Returns the per-field drift (aligned, changed, change_perc and, for list
+    attributes, added and removed items), the changed courses ordered by the
+    number of fields that changed and the number of added and removed courses.
+    """
+    attributes = [x for x in dict.fromkeys(list(old_df.columns) + list(new_df.columns)) if x not in KEY]
+    merged = old_df.merge(new_df, on=KEY, how="outer", suffixes=("_old", "_new"), indicator=True)
+
+    aligned = merged[merged["_merge"] == "both"].reset_index(drop=True)
+    changed = pd.DataFrame(index=aligned.index)
+    rows = []
+    for attr in attributes:
+        old, new = _side(aligned, attr, "_old", old_df), _side(aligned, attr, "_new", new_df)
+        changed[attr] = old.map(_serialize) != new.map(_serialize)
+
+        row = {"attribute": attr, "aligned": len(aligned), "changed": int(changed[attr].sum()),
+               "added": None, "removed": None}
+        if attr in LIST_ATTRS:
+            list_changes = _list_changes(old, new)
+            row["added"], row["removed"] = int(list_changes["added"].sum()), int(list_changes["removed"].sum())
+        rows.append(row)
+
+    drift_df = pd.DataFrame(rows, columns=["attribute", "aligned", "changed", "added", "removed"])
+    drift_df["change_perc"] = (drift_df["changed"] / drift_df["aligned"] * 100).where(drift_df["aligned"] > 0, 0.0)
+
+    courses_df = aligned[KEY].copy()
+    courses_df["changed_count"] = changed.sum(axis=1)
+    courses_df["changed_fields"] = changed.apply(lambda x: ",".join(x.index[x]), axis=1) if len(changed) else ""
+    courses_df = courses_df[courses_df["changed_count"] > 0] \
+        .sort_values(by=["changed_count", "link"], ascending=[False, True], kind="stable")
+
+    course_counts = {"added_courses": int((merged["_merge"] == "right_only").sum()),
+                     "removed_courses": int((merged["_merge"] == "left_only").sum())}
+    return drift_df, courses_df, course_counts
+
+
+def latest_pairs(patterns: list) -> list:
+    """Returns (previous, latest) snapshot entries of every university with at least two complete snapshots.
+
+    Shards and partial snapshots are left out by find_snapshot_entries, they would show
+    the courses of the other shards or not crawled yet as removed.
+    """
+    snapshots = pd.DataFrame(find_snapshot_entries(patterns))
+    pairs = []
+    if not snapshots.empty:
+        for _, university_df in snapshots.sort_values(by="timestamp", kind="stable").groupby("university"):
+            if len(university_df) > 1:
+                pairs.append(tuple(university_df.tail(2).to_dict("records")))
+    return pairs
+
+
+def compare(old: dict, new: dict):
+    drift_df, courses_df, course_counts = field_drift(load_snapshot(old["path"]), load_snapshot(new["path"]))
+    drift_df.insert(0, "base_timestamp", old["timestamp"])
+    drift_df.insert(0, "timestamp", new["timestamp"])
+    drift_df.insert(0, "university", new["university"])
+
+    university_alias, version = new["university"], new["version"]
+    directory = f"data/universities/{university_alias}/{version}"
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    drift_df.to_csv(f"{directory}/{university_alias}_drift_stats_{version}.csv", index=False)
+    courses_df.head(TOP_CHANGED_COURSES).to_csv(f"{directory}/{university_alias}_drift_courses_{version}.csv",
+                                                index=False)
+
+    logger.info("Drift of %s %s versus %s (%d added, %d removed courses) saved to path %s"
+                % (university_alias, new["timestamp"], old["timestamp"], course_counts["added_courses"],
+                   course_counts["removed_courses"], directory))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        pairs = [tuple(find_snapshot_entries(sys.argv[1:2]) + find_snapshot_entries(sys.argv[2:3]))]
+    else:
+        pairs = latest_pairs(TARGET_MANIFESTS)
+
+    if not pairs or any(len(x) != 2 for x in pairs):
+        logger.info("No snapshots to compare!")
+        sys.exit(0)
+
+    for old_snapshot, new_snapshot in pairs:
+        compare(old_snapshot, new_snapshot)
@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+import logging
+from pathlib import Path
+from datetime import datetime, timezone
+
+import pandas as pd
+
+sys.path.append(os.path.sep.join(os.getcwd().split(os.path.sep)[:-2]))
+
+from course_crawler.normalization import language_requirements_frame, normalize_language_requirements  # noqa: E402
+from course_crawler.snapshots import find_snapshot_entries, iter_courses  # noqa: E402
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Snapshot manifests, glob patterns or .txt lists (one snapshot path per line), override with command line arguments
+TARGET_COURSES_JSON = ["../data/courses/output/*/manifest.json"]
+
+GROUP_BY = ["university", "version", "test_name"]
+
+
+def load_language_requirements(snapshots: list) -> pd.DataFrame:
+    frames = []
+    for snapshot in snapshots:
+        try:
+            requirements_df = language_requirements_frame(
+                iter_courses(snapshot["path"], fields=["link", "qualification", "language_requirements"]))
+        except json.decoder.JSONDecodeError:
+            logger.warning("Exception while parsing %s" % snapshot["path"])
+            continue
+
+        requirements_df.insert(0, "version", snapshot["version"])
+        requirements_df.insert(0, "university", snapshot["university"])
+        frames.append(requirements_df)
+
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def score_summary(requirements_df: pd.DataFrame) -> pd.DataFrame:
+    """Returns requirement counts, parse rates and overall / component score statistics per university and test."""
+    return requirements_df.groupby(GROUP_BY, dropna=False).agg(
+        requirements=("score", "size"),
+        overall_parsed=("overall_score", "count"),
+        component_parsed=("component_score", "count"),
+        overall_min=("overall_score", "min"),
+        overall_median=("overall_score", "median"),
+        overall_max=("overall_score", "max"),
+        component_median=("component_score", "median")
+    ).reset_index()
+
+
+if __name__ == "__main__":
+    snapshots = find_snapshot_entries(sys.argv[1:] or TARGET_COURSES_JSON)
+    logger.info("Normalizing language requirements of %d snapshots" % len(snapshots))
+
+    requirements_df = load_language_requirements(snapshots)
+    if requirements_df.empty:
+        logger.info("No language requirements found!")
+        sys.exit(0)
+
+    requirements_df = normalize_language_requirements(requirements_df)
+
+    for (university_alias, version), university_df in requirements_df.groupby(["university", "version"], sort=False):
+        Path(f"data/universities/{university_alias}/{version}").mkdir(parents=True, exist_ok=True)
+        university_df.to_csv(f"data/universities/{university_alias}/{version}/"
+                             f"{university_alias}_language_requirements_{version}.csv", index=False)
+
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    Path(f"data/overall/{today}").mkdir(parents=True, exist_ok=True)
+    df_path = f"data/overall/{today}/language_stats_{today}.csv"
+    score_summary(requirements_df).to_csv(df_path, index=False)
+
+    logger.info("Language stats (%d of %d scores parsed) saved to path %s"
+                % (requirements_df["overall_score"].notna().sum(), len(requirements_df), df_path))
@@ -1,68 +1,78 @@
-import re
+import os
+import sys
 import json
 import logging
-from glob import glob
 from pathlib import Path
 from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
 
+sys.path.append(os.path.sep.join(os.getcwd().split(os.path.sep)[:-2]))
+
+from course_crawler.snapshots import find_snapshot_entries, iter_courses  # noqa: E402
+
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-TARGET_COURSES_JSON = "courses_leeds_2024-2025_2024-05-27T10:03:11.json"
+# Snapshot manifests, glob patterns or .txt lists (one snapshot path per line), override with command line arguments
+TARGET_COURSES_JSON = ["../data/courses/output/*/manifest.json"]
+
+# "csv" or "parquet" (requires pyarrow)
+REPORT_FORMAT = "csv"
+
+COLUMNS = ["university_alias", "academic_year", "timestamp", "url", "qualification", "issue"]
+
+
+def audit_snapshot(snapshot: dict) -> pd.DataFrame:
+    """Returns the courses of a snapshot with a missing or a comma-separated qualification."""
+    try:
+        courses_df = pd.DataFrame(iter_courses(snapshot["path"], fields=["link", "qualification"]),
+                                  columns=["link", "qualification"]).rename(columns={"link": "url"})
+    except json.decoder.JSONDecodeError:
+        logger.warning("Exception while parsing %s" % snapshot["path"])
+        return pd.DataFrame(columns=COLUMNS)
+
+    qualification = courses_df["qualification"].fillna("").astype(str)
+    missing = qualification.str.len() == 0
+    multiple = ~missing & qualification.str.contains(",", regex=False)
+
+    courses_df["issue"] = None
+    courses_df.loc[missing, "issue"] = "missing"
+    courses_df.loc[multiple, "issue"] = "multiple"
+    courses_df.loc[missing, "qualification"] = None
+
+    courses_df = courses_df[courses_df["issue"].notna()]
+    courses_df["university_alias"] = snapshot["university"]
+    courses_df["academic_year"] = snapshot["academic_year"]
+    courses_df["timestamp"] = snapshot["timestamp"]
+    return courses_df[COLUMNS]
 
 
 if __name__ == "__main__":
-    university_alias = re.findall(r"courses_(\w+)_.*", TARGET_COURSES_JSON).pop()
-
-    with open(f"../data/courses/output/{university_alias}/{TARGET_COURSES_JSON}", 'r') as f:
-        courses = json.load(f)
-
-    academic_year = TARGET_COURSES_JSON.split("_")[-2]
-    timestamp = re.findall(r"\d+-\d+-\d+T\d+:\d+:\d+", TARGET_COURSES_JSON).pop()
-
-    data_missing, data_multiple = [], []
-    for course in courses:
-        if not course["qualification"]:
-            data_missing.append({
-                "university_alias": university_alias,
-                "academic_year": academic_year,
-                "timestamp": timestamp,
-                "url": course["link"]
-            })
-        elif "," in course["qualification"]:
-            data_multiple.append({
-                "university_alias": university_alias,
-                "academic_year": academic_year,
-                "timestamp": timestamp,
-                "url": course["link"],
-                "qualification": course["qualification"]
-            })
-
-    df_missing = pd.DataFrame(data_missing)
-    df_multiple = pd.DataFrame(data_multiple)
+    snapshots = find_snapshot_entries(sys.argv[1:] or TARGET_COURSES_JSON)
+    logger.info("Auditing qualifications of %d snapshots" % len(snapshots))
+
+    with ProcessPoolExecutor() as executor:
+        frames = list(executor.map(audit_snapshot, snapshots))
+
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS)
+    df = df.sort_values(by=["academic_year", "university_alias", "issue"], ascending=True, kind="stable")
+    df = df.drop_duplicates()
 
     today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
     Path(f"data/overall/{today}").mkdir(parents=True, exist_ok=True)
 
-    if data_missing:
-        df_missing_path = f"data/overall/{today}/missing_qualification_stats_{today}.csv"
-        df_missing = df_missing.sort_values(by=["academic_year", "university_alias"], ascending=True)
-        df_missing = df_missing.drop_duplicates()
-        df_missing.to_csv(df_missing_path, index=False)
-
-        logger.info("Missing qualification stats saved to path %s" % df_missing_path)
+    df_path = f"data/overall/{today}/qualification_stats_{today}.{REPORT_FORMAT}"
+    if REPORT_FORMAT == "parquet":
+        df.to_parquet(df_path, index=False)
     else:
-        logger.info("All courses have qualifications set!")
-
-    if data_multiple:
-        df_multiple_path = f"data/overall/{today}/multiple_qualification_stats_{today}.csv"
-        df_multiple = df_multiple.sort_values(by=["academic_year", "university_alias"], ascending=True) \
-            if len(df_multiple) > 0 else df_multiple
-        df_multiple = df_multiple.drop_duplicates()
-        df_multiple.to_csv(df_multiple_path, index=False)
+        df.to_csv(df_path, index=False)
 
-        logger.info("Multiple qualification stats saved to path %s" % df_multiple_path)
-    else:
-        logger.info("All courses have a single qualification!")
+    for issue, message in [("missing", "All courses have qualifications set!"),
+                           ("multiple", "All courses have a single qualification!")]:
+        if not (df["issue"] == issue).any():
+            logger.info(message)
+    logger.info("Qualification stats (%d missing, %d multiple) saved to path %s"
+                % ((df["issue"] == "missing").sum(), (df["issue"] == "multiple").sum(), df_path))
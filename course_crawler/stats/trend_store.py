@@ -0,0 +1,188 @@
+import os
+import sys
+import sqlite3
+import logging
+from glob import glob
+from typing import Optional
+
+import pandas as pd
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TREND_STORE_DB = "data/trends.sqlite"
+
+UNIVERSITY_REVIEW_STATS_CSV = "data/universities/*/*/*_university_review_stats_*.csv"
+QUALIFICATION_STATS_CSV = "data/overall/*/*qualification_stats_*.csv"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingested_files (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    ingested_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS coverage (
+    university TEXT NOT NULL,
+    version TEXT NOT NULL,
+    attribute TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    nan_count INTEGER NOT NULL,
+    nan_perc REAL NOT NULL,
+    PRIMARY KEY (university, version, attribute)
+);
+CREATE TABLE IF NOT EXISTS coverage_monthly (
+    university TEXT NOT NULL,
+    attribute TEXT NOT NULL,
+    month TEXT NOT NULL,
+    versions INTEGER NOT NULL,
+    avg_nan_perc REAL NOT NULL,
+    min_nan_perc REAL NOT NULL,
+    max_nan_perc REAL NOT NULL,
+    last_version TEXT NOT NULL,
+    last_nan_perc REAL NOT NULL,
+    PRIMARY KEY (university, attribute, month)
+);
+CREATE TABLE IF NOT EXISTS catalogue_size (
+    university TEXT NOT NULL,
+    version TEXT NOT NULL,
+    courses INTEGER NOT NULL,
+    PRIMARY KEY (university, version)
+);
+CREATE TABLE IF NOT EXISTS qualification_issues (
+    university TEXT NOT NULL,
+    academic_year TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    issue TEXT NOT NULL,
+    courses INTEGER NOT NULL,
+    PRIMARY KEY (university, academic_year, timestamp, issue)
+);
+"""
+
+
+def connect(db_path: str = TREND_STORE_DB) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _new_files(conn: sqlite3.Connection, pattern: str) -> list:
+    """Returns the files matching the pattern which were not ingested yet or changed since."""
+    ingested = dict(((path, (mtime, size)) for path, mtime, size in
+                     conn.execute("SELECT path, mtime, size FROM ingested_files")))
+    files = []
+    for path in sorted(glob(pattern)):
+        stat = os.stat(path)
+        if ingested.get(path) != (stat.st_mtime, stat.st_size):
+            files.append((path, stat.st_mtime, stat.st_size))
+    return files
+
+
+def _mark_ingested(conn: sqlite3.Connection, files: list):
+    conn.executemany("INSERT OR REPLACE INTO ingested_files (path, mtime, size) VALUES (?, ?, ?)", files)
+
+
+def _ingest_coverage(conn: sqlite3.Connection, files: list) -> int:
+    if not files:
+        return 0
+
+    df = pd.concat([pd.read_csv(path, dtype={"version": str}) for path, _, _ in files], ignore_index=True)
+    df = df.drop_duplicates(subset=["university", "version", "attribute"], keep="last")
+    conn.executemany(
+        "INSERT OR REPLACE INTO coverage (university, version, attribute, count, nan_count, nan_perc) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        df[["university", "version", "attribute", "count", "nan_count", "nan_perc"]]
+        .astype({"count": int, "nan_count": int, "nan_perc": float})
+        .itertuples(index=False, name=None))
+
+    sizes = df[df["attribute"] == "link"][["university", "version", "count"]]
+    conn.executemany("INSERT OR REPLACE INTO catalogue_size (university, version, courses) VALUES (?, ?, ?)",
+                     sizes.astype({"count": int}).itertuples(index=False, name=None))
+
+    # only the (university, month) rollups touched by the new files are recomputed
+    months = df[["university", "version"]].assign(month=df["version"].str[:7])[["university", "month"]] \
+        .drop_duplicates()
+    for university, month in months.itertuples(index=False, name=None):
+        conn.execute("DELETE FROM coverage_monthly WHERE university = ? AND month = ?", (university, month))
+        conn.execute("""
+            INSERT INTO coverage_monthly (university, attribute, month, versions, avg_nan_perc, min_nan_perc,
+                                          max_nan_perc, last_version, last_nan_perc)
+            SELECT c.university, c.attribute, substr(c.version, 1, 7), COUNT(*), AVG(c.nan_perc),
+                   MIN(c.nan_perc), MAX(c.nan_perc), MAX(c.version),
+                   (SELECT l.nan_perc FROM coverage l
+                    WHERE l.university = c.university AND l.attribute = c.attribute
+                      AND substr(l.version, 1, 7) = substr(c.version, 1, 7)
+                    ORDER BY l.version DESC LIMIT 1)
+            FROM coverage c
+            WHERE c.university = ? AND substr(c.version, 1, 7) = ?
+            GROUP BY c.university, c.attribute, substr(c.version, 1, 7)""", (university, month))
+    return len(df)
+
+
+def _ingest_qualification_issues(conn: sqlite3.Connection, files: list) -> int:
+    frames = []
+    for path, _, _ in files:
+        df = pd.read_csv(path, dtype=str)
+        if "issue" not in df.columns:
+            # reports written before the consolidated qualification_stats_<date>.csv
+            df["issue"] = "missing" if os.path.basename(path).startswith("missing") else "multiple"
+        frames.append(df)
+    if not frames:
+        return 0
+
+    df = pd.concat(frames, ignore_index=True).drop_duplicates(subset=["university_alias", "timestamp", "url",
+                                                                      "qualification", "issue"])
+    counts = df.groupby(["university_alias", "academic_year", "timestamp", "issue"]).size().reset_index()
+    conn.executemany(
+        "INSERT OR REPLACE INTO qualification_issues (university, academic_year, timestamp, issue, courses) "
+        "VALUES (?, ?, ?, ?, ?)", counts.itertuples(index=False, name=None))
+    return len(counts)
+
+
+def ingest(conn: sqlite3.Connection, coverage_pattern: str = UNIVERSITY_REVIEW_STATS_CSV,
+           qualification_pattern: str = QUALIFICATION_STATS_CSV):
+    """Ingests the stats CSVs written since the last run and refreshes the affected rollups."""
+    coverage_files = _new_files(conn, coverage_pattern)
+    qualification_files = _new_files(conn, qualification_pattern)
+
+    with conn:
+        coverage_rows = _ingest_coverage(conn, coverage_files)
+        qualification_rows = _ingest_qualification_issues(conn, qualification_files)
+        _mark_ingested(conn, coverage_files + qualification_files)
+
+    logger.info("Ingested %d coverage rows from %d files and %d qualification rows from %d files"
+                % (coverage_rows, len(coverage_files), qualification_rows, len(qualification_files)))
+
+
+def coverage_trend(conn: sqlite3.Connection, university: Optional[str] = None, attribute: Optional[str] = None,
+                   since: Optional[str] = None, monthly: bool = True) -> pd.DataFrame:
+    """Returns the nan_perc trend per university and attribute, monthly rollups by default."""
+    table, period = ("coverage_monthly", "month") if monthly else ("coverage", "version")
+    query = f"SELECT * FROM {table} WHERE 1 = 1"
+    params = []
+    for column, value in [("university", university), ("attribute", attribute)]:
+        if value is not None:
+            query += f" AND {column} = ?"
+            params.append(value)
+    if since is not None:
+        query += f" AND {period} >= ?"
+        params.append(since[:7] if monthly else since)
+    return pd.read_sql_query(query + f" ORDER BY university, attribute, {period}", conn, params=params)
+
+
+def catalogue_size_trend(conn: sqlite3.Connection, university: Optional[str] = None) -> pd.DataFrame:
+    """Returns the number of courses per university and version."""
+    query = "SELECT * FROM catalogue_size"
+    params = []
+    if university is not None:
+        query += " WHERE university = ?"
+        params.append(university)
+    return pd.read_sql_query(query + " ORDER BY university, version", conn, params=params)
+
+
+if __name__ == "__main__":
+    conn = connect(sys.argv[1] if len(sys.argv) > 1 else TREND_STORE_DB)
+    ingest(conn)
+    conn.close()
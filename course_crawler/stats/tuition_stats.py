@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import logging
+from pathlib import Path
+from datetime import datetime, timezone
+
+import pandas as pd
+
+sys.path.append(os.path.sep.join(os.getcwd().split(os.path.sep)[:-2]))
+
+from course_crawler.normalization import normalize_tuitions, tuitions_frame  # noqa: E402
+from course_crawler.snapshots import find_snapshot_entries, iter_courses  # noqa: E402
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Snapshot manifests, glob patterns or .txt lists (one snapshot path per line), override with command line arguments
+TARGET_COURSES_JSON = ["../data/courses/output/*/manifest.json"]
+
+GROUP_BY = ["university", "version", "student_category", "study_mode_normalized", "fee_currency"]
+
+
+def load_tuitions(snapshots: list) -> pd.DataFrame:
+    frames = []
+    for snapshot in snapshots:
+        try:
+            tuitions_df = tuitions_frame(iter_courses(snapshot["path"], fields=["link", "qualification", "tuitions"]))
+        except json.decoder.JSONDecodeError:
+            logger.warning("Exception while parsing %s" % snapshot["path"])
+            continue
+
+        tuitions_df.insert(0, "version", snapshot["version"])
+        tuitions_df.insert(0, "university", snapshot["university"])
+        frames.append(tuitions_df)
+
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def fee_summary(tuitions_df: pd.DataFrame) -> pd.DataFrame:
+    """Returns tuition counts, parse rates and fee / duration statistics per university, category and mode."""
+    return tuitions_df.groupby(GROUP_BY, dropna=False).agg(
+        tuitions=("fee", "size"),
+        fee_parsed=("fee_amount", "count"),
+        duration_parsed=("duration_months", "count"),
+        fee_min=("fee_amount", "min"),
+        fee_median=("fee_amount", "median"),
+        fee_max=("fee_amount", "max"),
+        duration_months_median=("duration_months", "median")
+    ).reset_index()
+
+
+if __name__ == "__main__":
+    snapshots = find_snapshot_entries(sys.argv[1:] or TARGET_COURSES_JSON)
+    logger.info("Normalizing tuitions of %d snapshots" % len(snapshots))
+
+    tuitions_df = load_tuitions(snapshots)
+    if tuitions_df.empty:
+        logger.info("No tuitions found!")
+        sys.exit(0)
+
+    tuitions_df = normalize_tuitions(tuitions_df)
+
+    for (university_alias, version), university_df in tuitions_df.groupby(["university", "version"], sort=False):
+        Path(f"data/universities/{university_alias}/{version}").mkdir(parents=True, exist_ok=True)
+        university_df.to_csv(f"data/universities/{university_alias}/{version}/"
+                             f"{university_alias}_tuitions_{version}.csv", index=False)
+
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    Path(f"data/overall/{today}").mkdir(parents=True, exist_ok=True)
+    df_path = f"data/overall/{today}/tuition_stats_{today}.csv"
+    fee_summary(tuitions_df).to_csv(df_path, index=False)
+
+    logger.info("Tuition stats (%d of %d fees parsed) saved to path %s"
+                % (tuitions_df["fee_amount"].notna().sum(), len(tuitions_df), df_path))
@@ -1,89 +1,117 @@
+import os
+import sys
 import json
-import re
-from glob import glob
+import logging
 from pathlib import Path
-from copy import deepcopy
-from datetime import datetime
+from datetime import datetime, timezone
 
-import numpy as np
 import pandas as pd
-from functional import seq
 
+sys.path.append(os.path.sep.join(os.getcwd().split(os.path.sep)[:-2]))
 
-TARGET_COURSES_JSON = "courses_oxford_2024-2025_2024-06-04T02:59:03.json"
+from course_crawler.coverage import SIMPLE_ATTRS, COMPLEX_ATTRS, NESTED_ATTRS, child_attribute  # noqa: E402
+from course_crawler.snapshots import find_snapshot_entries, iter_courses  # noqa: E402
 
 
-if __name__ == "__main__":
-    simple_attrs = ["link", "title", "study_level", "qualification", "university_title",
-                    "description", "about", "entry_requirements"]
-    complex_attrs = ["locations", "start_dates", "application_dates"]
-    nested_attrs = {
-        "tuitions": ["study_mode", "duration", "student_category", "fee"],
-        "language_requirements": ["language", "test", "score"],
-        "modules": ["type", "title", "link"]
-    }
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Snapshot manifests, glob patterns or .txt lists (one snapshot path per line), override with command line arguments
+TARGET_COURSES_JSON = ["../data/courses/output/*/manifest.json"]
+
+GROUP_BY = ["university", "version"]
+
+
+def load_courses(snapshots: list) -> pd.DataFrame:
+    frames = []
+    for snapshot in snapshots:
+        # simple and complex attributes are only tested for truthiness, e.g. the large about HTML
+        courses = iter_courses(snapshot["path"],
+                               fields=SIMPLE_ATTRS + COMPLEX_ATTRS + list(NESTED_ATTRS.keys()),
+                               flags=SIMPLE_ATTRS + COMPLEX_ATTRS)
+        try:
+            courses_df = pd.DataFrame(courses, columns=SIMPLE_ATTRS + COMPLEX_ATTRS + list(NESTED_ATTRS.keys()))
+        except json.decoder.JSONDecodeError:
+            logger.warning("Exception while parsing %s" % snapshot["path"])
+            continue
+
+        courses_df["university"] = snapshot["university"]
+        courses_df["version"] = snapshot["version"]
+        frames.append(courses_df)
+
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def field_coverage(courses_df: pd.DataFrame) -> pd.DataFrame:
+    groups = courses_df[GROUP_BY]
+    course_count = groups.value_counts(sort=False).rename("courses")
+
+    # 1 for every set attribute, missing keys and None count as unset
+    filled = courses_df[SIMPLE_ATTRS + COMPLEX_ATTRS].fillna(False).astype(bool)
+    lengths = courses_df[list(NESTED_ATTRS.keys())].apply(lambda x: x.astype(object).str.len()).fillna(0).astype(int)
+
+    filled_count = pd.concat([groups, filled, lengths.gt(0)], axis=1).groupby(GROUP_BY).sum()
+    children_count = pd.concat([groups, lengths], axis=1).groupby(GROUP_BY).sum()
 
     data = []
-    university_alias = re.findall(r"courses_(\w+)_.*", TARGET_COURSES_JSON).pop()
-    version = re.findall(r"\d+-\d+-\d+", TARGET_COURSES_JSON).pop()
-    try:
-        with open(f"../data/courses/output/{university_alias}/{TARGET_COURSES_JSON}", 'r') as f:
-            courses = json.load(f)
-
-        courses_df = pd.DataFrame(courses)
-
-        for attr in simple_attrs + complex_attrs:
-            courses_df[attr] = courses_df[attr].apply(lambda x: 1 if x else 0)
-
-        for attr in nested_attrs.keys():
-            for child_attr in nested_attrs[attr]:
-                courses_df[f"{attr[:-1]}__{child_attr}"] = courses_df[attr]\
-                    .apply(lambda x: sum([1 if item[child_attr] else 0 for item in x]))
-
-            courses_df[attr] = courses_df[attr].apply(lambda x: len(x))
-
-        for attr in simple_attrs + complex_attrs:
-            data.append({
-                "university": university_alias,
-                "version": version,
-                "attribute": attr,
-                "count": len(courses_df[attr]),
-                "nan_count": (courses_df[attr] == 0).sum(),
-                "nan_perc": ((courses_df[attr] == 0).sum() / len(courses_df)) * 100
-            })
-
-        for attr in nested_attrs.keys():
-            data.append({
-                "university": university_alias,
-                "version": version,
-                "attribute": attr,
-                "count": len(courses_df[courses_df[attr] > 0]),
-                "nan_count": (courses_df[attr] == 0).sum(),
-                "nan_perc": ((courses_df[attr] == 0).sum() / len(courses_df[attr])) * 100
-            })
-
-            for child_attr in nested_attrs[attr]:
-                child_attr = f"{attr[:-1]}__{child_attr}"
-
-                count = sum(courses_df[attr])
-                nan_count = seq(zip(courses_df[(courses_df[attr] > 0)][attr],
-                                    courses_df[(courses_df[attr] > 0)][child_attr]))\
-                    .map(lambda x: x[0] - x[1])\
-                    .sum()
-
-                data.append({
-                    "university": university_alias,
-                    "version": version,
-                    "attribute": child_attr,
-                    "count": count,
-                    "nan_count": nan_count if count else -1,
-                    "nan_perc": (nan_count / count) * 100 if count else 100
-                })
-    except (KeyError, json.decoder.JSONDecodeError):
-        print("Exception while parsing %s" % TARGET_COURSES_JSON)
-
-    df = pd.DataFrame(data)
-    Path(f"data/universities/{university_alias}/{version}").mkdir(parents=True, exist_ok=True)
-
-    df = df.sort_values(by=['university', 'version'], ascending=True)
-    df.to_csv(f"data/universities/{university_alias}/{version}/{university_alias}_university_review_stats_{version}.csv", index=False)
+    for attr in SIMPLE_ATTRS + COMPLEX_ATTRS:
+        data.append(pd.DataFrame({
+            "attribute": attr,
+            "count": course_count,
+            "nan_count": course_count - filled_count[attr],
+            "total": course_count
+        }))
+
+    for attr, child_attrs in NESTED_ATTRS.items():
+        data.append(pd.DataFrame({
+            "attribute": attr,
+            "count": filled_count[attr],
+            "nan_count": course_count - filled_count[attr],
+            "total": course_count
+        }))
+
+        # one row per nested item, keyed by the university and version of its course
+        children = courses_df[attr].explode().dropna()
+        children_df = pd.json_normalize(children.tolist()).reindex(columns=child_attrs)
+        children_df = pd.concat([groups.loc[children.index].reset_index(drop=True),
+                                 children_df.fillna(False).astype(bool)], axis=1)
+        children_filled = children_df.groupby(GROUP_BY).sum().reindex(course_count.index, fill_value=0)
+
+        for child_attr in child_attrs:
+            count = children_count[attr]
+            data.append(pd.DataFrame({
+                "attribute": child_attribute(attr, child_attr),
+                "count": count,
+                "nan_count": (count - children_filled[child_attr]).where(count > 0, -1),
+                "total": count
+            }))
+
+    df = pd.concat(data).reset_index()
+    df["nan_perc"] = ((df["nan_count"] / df["total"]) * 100).where(df["total"] > 0, 100.0)
+
+    return df.sort_values(by=GROUP_BY, ascending=True, kind="stable")[
+        GROUP_BY + ["attribute", "count", "nan_count", "nan_perc"]]
+
+
+if __name__ == "__main__":
+    snapshots = find_snapshot_entries(sys.argv[1:] or TARGET_COURSES_JSON)
+    logger.info("Computing field coverage of %d snapshots" % len(snapshots))
+
+    courses_df = load_courses(snapshots)
+    if courses_df.empty:
+        logger.info("No courses found!")
+        sys.exit(0)
+
+    df = field_coverage(courses_df)
+
+    for (university_alias, version), university_df in df.groupby(GROUP_BY, sort=False):
+        Path(f"data/universities/{university_alias}/{version}").mkdir(parents=True, exist_ok=True)
+        university_df.to_csv(f"data/universities/{university_alias}/{version}/"
+                             f"{university_alias}_university_review_stats_{version}.csv", index=False)
+
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    Path(f"data/overall/{today}").mkdir(parents=True, exist_ok=True)
+    df_path = f"data/overall/{today}/university_review_stats_{today}.csv"
+    df.to_csv(df_path, index=False)
+
+    logger.info("University review stats saved to path %s" % df_path)
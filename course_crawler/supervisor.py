@@ -0,0 +1,306 @@
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import argparse
+import subprocess
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from scrapy.spiderloader import SpiderLoader
+from scrapy.utils.project import get_project_settings
+
+from course_crawler.run import SPIDERS_DIR
+from course_crawler.sharding import supports_shards
+from course_crawler.snapshots import iter_courses, read_manifest, snapshot_entry, update_manifest
+
+
+logger = logging.getLogger(__name__)
+
+# stats whose change shows that a worker is making progress
+PROGRESS_STATS = ["response_received_count", "item_scraped_count"]
+
+
+def _utc_timestamp() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+class Worker(object):
+    """One `scrapy crawl` process of a spider or of one of its shards, restarted with a new timestamp per attempt."""
+
+    def __init__(self, spider: str, run_dir: Path, spider_args: Optional[dict] = None,
+                 settings: Optional[dict] = None, shard: Optional[int] = None, shards: int = 1):
+        self.spider = spider
+        self.spider_args = spider_args or {}
+        self.settings = settings or {}
+        # as in the feed file names, see course_crawler.sharding.shard_suffix
+        self.shard = None if shard is None else f"{shard}of{shards}"
+        self.key = spider if shard is None else f"{spider}_shard{self.shard}"
+        self.run_dir = run_dir
+        if shard is not None:
+            self.spider_args.update(shard=shard, shards=shards)
+
+        self.process = None
+        self.attempts = []
+        self.timestamp = None
+        self.started = None
+        self.last_progress = None
+        self.last_progress_time = None
+
+    @property
+    def stats_path(self) -> Path:
+        return self.run_dir / "stats" / f"{self.key}_{len(self.attempts)}.json"
+
+    @property
+    def log_path(self) -> Path:
+        return self.run_dir / "logs" / f"{self.key}_{len(self.attempts)}.log"
+
+    def start(self):
+        self.attempts.append({})
+        self.timestamp = _utc_timestamp()
+        self.started = self.last_progress_time = time.time()
+        self.last_progress = None
+
+        command = [sys.executable, "-m", "scrapy", "crawl", self.spider,
+                   "-a", f"timestamp={self.timestamp}",
+                   "-s", f"STATS_DUMP_URI={self.stats_path.resolve()}"]
+        for k, v in self.spider_args.items():
+            command += ["-a", f"{k}={v}"]
+        for k, v in self.settings.items():
+            command += ["-s", f"{k}={v}"]
+
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.log_path, 'wb') as log:
+            self.process = subprocess.Popen(command, cwd=SPIDERS_DIR, stdout=log, stderr=subprocess.STDOUT)
+        logger.info("Started worker %s (attempt %d, pid %d)" % (self.key, len(self.attempts), self.process.pid))
+
+    def read_stats(self) -> Optional[dict]:
+        try:
+            with open(self.stats_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.decoder.JSONDecodeError):
+            return None
+
+    def is_stalled(self, stall_timeout: float) -> bool:
+        """True when the progress stats did not change for stall_timeout seconds."""
+        stats = self.read_stats() or {}
+        progress = tuple(stats.get(x, 0) for x in PROGRESS_STATS)
+        if progress != self.last_progress:
+            self.last_progress, self.last_progress_time = progress, time.time()
+        return time.time() - self.last_progress_time > stall_timeout
+
+    def stop(self, timeout: float = 30):
+        self.process.send_signal(signal.SIGINT)
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def finish(self, returncode: int, error: Optional[str] = None) -> bool:
+        """Records the finished attempt, returns whether the crawl completed with finish reason `finished`."""
+        stats = self.read_stats()
+        finish_reason = stats.get("finish_reason") if stats else None
+        if error is None and returncode != 0:
+            error = f"exit code {returncode}"
+        elif error is None and finish_reason is None:
+            error = "no final stats"
+        elif error is None and finish_reason != "finished":
+            # e.g. closed by a quality gate or a CLOSESPIDER_* limit, its feed is partial
+            error = f"finish reason {finish_reason}"
+
+        self.attempts[-1].update({
+            "timestamp": self.timestamp,
+            "returncode": returncode,
+            "finish_reason": finish_reason,
+            "error": error,
+            "elapsed": round(time.time() - self.started, 1),
+            "item_count": stats.get("item_scraped_count", 0) if stats else 0,
+            "stats": str(self.stats_path.relative_to(self.run_dir)),
+            "log": str(self.log_path.relative_to(self.run_dir))
+        })
+        return error is None
+
+
+class Supervisor(object):
+    """Runs spiders as worker processes, at most `workers` at a time, and merges their outputs.
+
+    With `shards` > 1 every spider declaring shard support is split into that many workers,
+    each crawling the courses of one shard (see course_crawler.sharding) into its own feed,
+    the other spiders run in one worker. Once every shard of a spider succeeded, their feeds
+    are merged into one snapshot named with the run id.
+    """
+
+    def __init__(self, settings, spiders: List[str], workers: Optional[int] = None, shards: int = 1):
+        self.settings = settings
+        self.max_workers = workers or settings.getint("SUPERVISOR_WORKERS") or os.cpu_count() or 1
+        self.max_restarts = settings.getint("SUPERVISOR_MAX_RESTARTS")
+        self.stall_timeout = settings.getfloat("SUPERVISOR_STALL_TIMEOUT")
+        self.poll_interval = settings.getfloat("SUPERVISOR_POLL_INTERVAL")
+        self.output_dir = SPIDERS_DIR / settings.get("COURSE_OUTPUT_DIR")
+
+        self.run_id = _utc_timestamp()
+        self.run_dir = (SPIDERS_DIR / settings.get("SUPERVISOR_RUNS_DIR") / self.run_id).resolve()
+        self.shards = shards
+        self.workers = []
+        spider_loader = SpiderLoader.from_settings(settings) if shards > 1 else None
+        for spider in spiders:
+            if spider_loader and supports_shards(spider_loader.load(spider)):
+                # a shard's delta would report the courses of the other shards as removed
+                self.workers += [Worker(spider, self.run_dir, settings={"COURSE_DELTA_ENABLED": False},
+                                        shard=i, shards=shards) for i in range(shards)]
+            else:
+                if shards > 1:
+                    logger.warning("Spider %s does not support shards, it runs in one worker" % spider)
+                self.workers.append(Worker(spider, self.run_dir))
+
+    def run(self) -> dict:
+        pending, running, done = list(self.workers), [], []
+        started = _utc_timestamp()
+        logger.info("Run %s: %d workers, at most %d at a time" % (self.run_id, len(pending), self.max_workers))
+
+        try:
+            while pending or running:
+                while pending and len(running) < self.max_workers:
+                    worker = pending.pop(0)
+                    worker.start()
+                    running.append(worker)
+
+                time.sleep(self.poll_interval)
+                for worker in list(running):
+                    returncode, error = worker.process.poll(), None
+                    if returncode is None and worker.is_stalled(self.stall_timeout):
+                        logger.warning("Worker %s made no progress for %ds, stopping it"
+                                       % (worker.key, self.stall_timeout))
+                        worker.stop()
+                        returncode, error = worker.process.returncode, "stalled"
+                    if returncode is None:
+                        continue
+
+                    running.remove(worker)
+                    if worker.finish(returncode, error):
+                        done.append(worker)
+                    elif len(worker.attempts) <= self.max_restarts:
+                        logger.warning("Worker %s failed (%s), restarting" % (worker.key, worker.attempts[-1]["error"]))
+                        pending.append(worker)
+                    else:
+                        logger.error("Worker %s failed (%s), giving up after %d attempts"
+                                     % (worker.key, worker.attempts[-1]["error"], len(worker.attempts)))
+                        done.append(worker)
+        except KeyboardInterrupt:
+            logger.warning("Interrupted, stopping %d running workers" % len(running))
+            for worker in running:
+                worker.stop()
+                worker.finish(worker.process.returncode, "interrupted")
+
+        merged = self.merge_shards() if self.shards > 1 else []
+        return self.write_manifest(started, merged)
+
+    def _worker_feeds(self, worker: Worker) -> List[dict]:
+        timestamps = [x.get("timestamp") for x in worker.attempts]
+        return [{**x, "path": str((self.output_dir / worker.spider / x["file"]).resolve())}
+                for x in read_manifest(str(self.output_dir / worker.spider))
+                if x["timestamp"] in timestamps and x.get("shard") == worker.shard]
+
+    def _shard_feed(self, worker: Worker) -> Optional[dict]:
+        """Returns the complete JSON feed of a shard, None when it was not found.
+
+        An attempt resumed from the checkpoint of an interrupted one keeps its timestamp and
+        completes its feed (see ManifestFileFeedStorage), an attempt which started over
+        writes a new one, so the latest feed which is not partial holds every course.
+        """
+        feeds = [x for x in self._worker_feeds(worker)
+                 if Path(x["file"]).suffix in (".json", ".jsonl") and not x.get("partial")]
+        return feeds[-1] if feeds else None
+
+    def merge_shards(self) -> List[dict]:
+        """Merges the JSON feeds of the shards of every spider whose shards all succeeded."""
+        merged = []
+        for spider in dict.fromkeys(x.spider for x in self.workers if x.shard is not None):
+            workers = [x for x in self.workers if x.spider == spider]
+            if not all(x.attempts and x.attempts[-1].get("error") is None for x in workers):
+                logger.error("Not every shard of %s succeeded, its shards are not merged" % spider)
+                continue
+
+            feeds = [self._shard_feed(x) for x in workers]
+            missing = [x.key for x, feed in zip(workers, feeds) if feed is None]
+            if missing:
+                logger.error("No complete JSON feed of %s was found in the manifest, the shards of %s are not merged"
+                             % (", ".join(missing), spider))
+                continue
+
+            path = self.output_dir / spider / \
+                f"courses_{spider}_{self.settings.get('ACADEMIC_YEAR')}_{self.run_id}.json"
+            item_count = 0
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write("[")
+                for feed in feeds:
+                    for course in iter_courses(feed["path"]):
+                        f.write(",\n" if item_count else "\n")
+                        f.write(json.dumps(course, ensure_ascii=False))
+                        item_count += 1
+                f.write("\n]")
+
+            entry = snapshot_entry(str(path), university=spider, academic_year=self.settings.get("ACADEMIC_YEAR"),
+                                   timestamp=self.run_id, item_count=item_count, format="json",
+                                   shards=[x["file"] for x in feeds])
+            update_manifest(str(path.parent), entry)
+            merged.append({**entry, "path": str(path.resolve())})
+            logger.info("Merged %d shards of %s into %s (%d courses)" % (len(feeds), spider, path, item_count))
+        return merged
+
+    def write_manifest(self, started: str, merged: Optional[List[dict]] = None) -> dict:
+        workers, stats = [], {}
+        for worker in self.workers:
+            attempt_stats = (worker.read_stats() or {}) if worker.attempts else {}
+            for k, v in attempt_stats.items():
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    stats[k] = stats.get(k, 0) + v
+
+            workers.append({
+                "key": worker.key,
+                "spider": worker.spider,
+                "spider_args": worker.spider_args,
+                "succeeded": bool(worker.attempts) and worker.attempts[-1].get("error") is None,
+                "attempts": worker.attempts,
+                "feeds": self._worker_feeds(worker)
+            })
+
+        manifest = {
+            "run_id": self.run_id,
+            "started": started,
+            "finished": _utc_timestamp(),
+            "succeeded": all(x["succeeded"] for x in workers),
+            "item_count": sum(x["attempts"][-1].get("item_count", 0) for x in workers if x["attempts"]),
+            "workers": workers,
+            "merged": merged or [],
+            "stats": stats
+        }
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.run_dir / "manifest.json", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        logger.info("Run %s finished, %d of %d workers succeeded, manifest saved to path %s"
+                    % (self.run_id, sum(x["succeeded"] for x in workers), len(workers), self.run_dir / "manifest.json"))
+        return manifest
+
+
+if __name__ == "__main__":
+    # python -m course_crawler.supervisor [--workers N] [--shards K] [<spider> ...]
+    parser = argparse.ArgumentParser(description="Crawls the spiders in parallel worker processes")
+    parser.add_argument("spiders", nargs="*", help="spiders to run, default all but RUN_EXCLUDED_SPIDERS")
+    parser.add_argument("--workers", type=int, default=None, help="maximum number of worker processes")
+    parser.add_argument("--shards", type=int, default=1, help="split every spider into K workers, one per shard")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(name)s] %(levelname)s: %(message)s")
+    os.chdir(SPIDERS_DIR)
+    settings = get_project_settings()
+
+    spiders = args.spiders or [x for x in SpiderLoader.from_settings(settings).list()
+                               if x not in settings.getlist("RUN_EXCLUDED_SPIDERS")]
+    manifest = Supervisor(settings, spiders, args.workers, args.shards).run()
+    sys.exit(0 if manifest["succeeded"] else 1)
@@ -0,0 +1,42 @@
+import os
+import pickle
+import time
+from types import SimpleNamespace
+
+from course_crawler.checkpoint import CrawlCheckpoint
+
+
+def write_checkpoint(path, age: float):
+    with open(path, 'wb') as f:
+        pickle.dump({"spider": "example", "timestamp": "2024-01-01T00:00:00", "requests": [], "finished": set(),
+                     "fingerprints": set(), "attributes": {}}, f)
+    os.utime(path, (time.time() - age, time.time() - age))
+
+
+def read_checkpoint(tmp_path, max_age: float):
+    middleware = CrawlCheckpoint(SimpleNamespace(stats=None), str(tmp_path / "%(name)s.pickle"), 60.0, True,
+                                 max_age=max_age, discard_reasons=["extraction_quality_collapse"])
+    spider = SimpleNamespace(name="example", timestamp="2024-02-01T00:00:00")
+    middleware.read(spider)
+    return middleware, spider
+
+
+def test_recent_checkpoint_is_resumed(tmp_path):
+    write_checkpoint(tmp_path / "example.pickle", age=60)
+    middleware, spider = read_checkpoint(tmp_path, max_age=3600)
+    assert middleware.checkpoint is not None
+    assert spider.timestamp == "2024-01-01T00:00:00" and spider.resumed
+
+
+def test_old_checkpoint_is_ignored(tmp_path):
+    write_checkpoint(tmp_path / "example.pickle", age=7200)
+    middleware, spider = read_checkpoint(tmp_path, max_age=3600)
+    assert middleware.checkpoint is None
+    assert spider.timestamp == "2024-02-01T00:00:00" and not getattr(spider, "resumed", False)
+
+
+def test_discarded_crawl_leaves_no_checkpoint(tmp_path):
+    write_checkpoint(tmp_path / "example.pickle", age=60)
+    middleware, spider = read_checkpoint(tmp_path, max_age=3600)
+    middleware.spider_closed(spider, "extraction_quality_collapse")
+    assert not (tmp_path / "example.pickle").exists()
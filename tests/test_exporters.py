@@ -0,0 +1,40 @@
+import io
+
+from openpyxl import load_workbook
+
+from course_crawler.exporters import COURSE_COLUMNS, CourseExcelItemExporter
+
+
+def export(courses: list):
+    f = io.BytesIO()
+    exporter = CourseExcelItemExporter(f)
+    exporter.start_exporting()
+    for course in courses:
+        exporter.export_item(course)
+    exporter.finish_exporting()
+    f.seek(0)
+    return load_workbook(f)
+
+
+def test_excel_columns_do_not_depend_on_the_first_course():
+    workbook = export([
+        {"link": "https://example.org/courses/1", "title": "Course 1"},
+        {"link": "https://example.org/courses/2", "title": "Course 2", "qualification": "MSc",
+         "tuitions": [{"study_mode": "Full-time", "fee": "£12,000"}]}
+    ])
+
+    rows = [[x.value for x in row] for row in workbook["courses"].iter_rows()]
+    assert rows[0] == ["course_id", *COURSE_COLUMNS]
+    assert rows[2][rows[0].index("qualification")] == "MSc"
+    assert [[x.value for x in row] for row in workbook["tuitions"].iter_rows()][1] == \
+        [2, "Full-time", None, None, "£12,000"]
+
+
+def test_excel_cells_starting_with_equals_are_text():
+    workbook = export([{"link": "https://example.org/courses/1", "title": "=HYPERLINK(\"https://example.org\")",
+                        "modules": [{"type": "Core", "title": "=1+1", "link": ""}]}])
+
+    title = workbook["courses"].cell(row=2, column=1 + 1 + COURSE_COLUMNS.index("title"))
+    assert (title.value, title.data_type) == ("=HYPERLINK(\"https://example.org\")", "s")
+    module_title = workbook["modules"].cell(row=2, column=3)
+    assert (module_title.value, module_title.data_type) == ("=1+1", "s")
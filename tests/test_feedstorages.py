@@ -0,0 +1,96 @@
+import json
+import hashlib
+from types import SimpleNamespace
+
+import pytest
+from scrapy.settings import Settings
+from scrapy.statscollectors import MemoryStatsCollector
+
+from course_crawler.feedstorages import S3_MIN_PART_SIZE, ManifestFileFeedStorage, S3MultipartFeedStorage
+from course_crawler.snapshots import read_manifest
+
+
+ACADEMIC_YEAR = "2024-2025"
+TIMESTAMP = "2024-01-01T00:00:00"
+
+
+def make_course(i: int) -> dict:
+    return {"link": f"https://example.org/courses/{i}", "title": f"Course {i}"}
+
+
+@pytest.fixture
+def s3():
+    boto3 = pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+    with moto.mock_s3():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="courses")
+        yield client
+
+
+def open_s3_storage(stats=None):
+    storage = S3MultipartFeedStorage("s3://courses/example/courses_example.json", access_key="key", secret_key="secret",
+                                     region_name="us-east-1", part_size=S3_MIN_PART_SIZE, max_pending_parts=2,
+                                     stats=stats, academic_year=ACADEMIC_YEAR)
+    return storage, storage.open(SimpleNamespace(name="example", timestamp=TIMESTAMP))
+
+
+def test_s3_feed_is_uploaded_in_parts(s3):
+    stats = MemoryStatsCollector(SimpleNamespace(settings=Settings()))
+    stats.set_value("item_scraped_count", 3)
+    storage, file = open_s3_storage(stats)
+    content = b"".join(bytes([i]) * S3_MIN_PART_SIZE for i in range(2)) + b"last part"
+    for offset in range(0, len(content), 1 << 20):
+        file.write(content[offset:offset + (1 << 20)])
+    storage._store_in_thread(file)
+
+    assert s3.get_object(Bucket="courses", Key="example/courses_example.json")["Body"].read() == content
+    manifest = json.loads(s3.get_object(Bucket="courses", Key="example/courses_example.json.manifest.json")["Body"]
+                          .read())
+    assert manifest["university"] == "example" and manifest["timestamp"] == TIMESTAMP
+    assert manifest["item_count"] == 3 and manifest["byte_size"] == len(content)
+    assert manifest["sha256"] == hashlib.sha256(content).hexdigest()
+    assert [x["Size"] for x in manifest["parts"]] == [S3_MIN_PART_SIZE, S3_MIN_PART_SIZE, len(b"last part")]
+
+
+def test_s3_upload_is_aborted_on_error(s3):
+    storage, file = open_s3_storage()
+    upload_part = storage.client.upload_part
+
+    def failing_upload_part(**kwargs):
+        if kwargs["PartNumber"] == 2:
+            raise OSError("connection reset")
+        return upload_part(**kwargs)
+
+    storage.client.upload_part = failing_upload_part
+    file.write(b"x" * (2 * S3_MIN_PART_SIZE + 1))
+    with pytest.raises(OSError):
+        storage._store_in_thread(file)
+
+    assert not s3.list_multipart_uploads(Bucket="courses").get("Uploads")
+    assert "Contents" not in s3.list_objects_v2(Bucket="courses")
+
+
+def test_resumed_feed_skips_courses_scraped_again(tmp_path):
+    path = tmp_path / f"courses_example_{ACADEMIC_YEAR}_{TIMESTAMP}.jsonl"
+    # killed while writing course 2
+    path.write_text("".join(json.dumps(make_course(i)) + "\n" for i in range(2)) + '{"link": "https://exa',
+                    encoding='utf-8')
+
+    stats = MemoryStatsCollector(SimpleNamespace(settings=Settings()))
+    spider = SimpleNamespace(name="example", timestamp=TIMESTAMP, resumed=True)
+    storage = ManifestFileFeedStorage(str(path), stats=stats, academic_year=ACADEMIC_YEAR,
+                                      feed_options={"format": "jsonlines"})
+    file = storage.open(spider)
+    # the request of course 1 was in progress when the crawl was interrupted
+    for i in range(1, 4):
+        file.write((json.dumps(make_course(i)) + "\n").encode("utf-8"))
+    stats.set_value("item_scraped_count", 3)
+    stats.set_value("finish_reason", "finished")
+    file.close()
+    storage._store_in_thread()
+
+    assert [json.loads(x) for x in path.read_text(encoding='utf-8').splitlines()] == \
+        [make_course(i) for i in range(4)]
+    entry, = read_manifest(str(tmp_path))
+    assert entry["item_count"] == 4 and not entry.get("partial")
@@ -0,0 +1,41 @@
+from scrapy import Request, Spider
+from scrapy.utils.test import get_crawler
+
+from course_crawler.frontier import FrontierScheduler
+
+
+class ExampleSpider(Spider):
+    name = "example"
+
+
+def run_scheduler(tmp_path, reason: str, node: str = "node"):
+    """Opens a scheduler, enqueues the same request twice and closes it, returns the requests it dequeued."""
+    crawler = get_crawler(ExampleSpider, {
+        "SCHEDULER": "course_crawler.frontier.FrontierScheduler",
+        "DUPEFILTER_CLASS": "course_crawler.frontier.FrontierDupeFilter",
+        "FRONTIER_URI": str(tmp_path / "%(name)s.sqlite"),
+        "FRONTIER_NODE_ID": node,
+        "FRONTIER_IDLE_TIMEOUT": 60.0,
+        "REQUEST_FINGERPRINTER_IMPLEMENTATION": "2.7"
+    })
+    spider = ExampleSpider.from_crawler(crawler)
+    scheduler = FrontierScheduler.from_crawler(crawler)
+    scheduler.open(spider)
+    scheduler.enqueue_request(Request("https://example.org/courses/1"))
+    scheduler.enqueue_request(Request("https://example.org/courses/1"))
+    requests = []
+    while (request := scheduler.next_request()) is not None:
+        requests.append(request.url)
+    scheduler.close(reason)
+    return requests
+
+
+def test_finished_crawl_clears_the_frontier(tmp_path):
+    assert run_scheduler(tmp_path, "finished") == ["https://example.org/courses/1"]
+    assert run_scheduler(tmp_path, "finished") == ["https://example.org/courses/1"]
+
+
+def test_interrupted_crawl_keeps_the_fingerprints(tmp_path):
+    assert run_scheduler(tmp_path, "shutdown") == ["https://example.org/courses/1"]
+    assert run_scheduler(tmp_path, "finished") == []
+    assert run_scheduler(tmp_path, "finished") == ["https://example.org/courses/1"]
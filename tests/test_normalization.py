@@ -0,0 +1,34 @@
+import pandas as pd
+
+from course_crawler.normalization import LanguageScoreIndex, language_requirements_frame, \
+    normalize_fees, normalize_language_requirements
+
+
+def test_language_score_index_skips_requirements_without_test():
+    courses = [
+        {"link": "https://example.org/courses/1", "qualification": "MSc",
+         "language_requirements": [{"language": "English", "test": "IELTS", "score": "6.5 overall, 6.0 in each"}]},
+        {"link": "https://example.org/courses/2", "qualification": "MSc",
+         "language_requirements": [{"language": "English", "test": None, "score": "7.0"},
+                                   {"language": "English", "test": "TOEFL", "score": "100"}]},
+        {"link": "https://example.org/courses/3", "qualification": "MA",
+         "language_requirements": [{"language": "English", "test": "IELTS", "score": "7.5"}]}
+    ]
+    index = LanguageScoreIndex(normalize_language_requirements(language_requirements_frame(courses)))
+
+    assert index.courses_accepting("IELTS", 7.0)["link"].tolist() == ["https://example.org/courses/1"]
+    assert index.courses_accepting("IELTS", 7.0, component_score=5.5).empty
+    assert index.courses_accepting("TOEFL iBT", 100)["link"].tolist() == ["https://example.org/courses/2"]
+    assert index.requirements_between("IELTS", 7.0)["link"].tolist() == ["https://example.org/courses/3"]
+
+
+def test_normalize_fees_takes_the_amount_next_to_its_currency():
+    fees = pd.Series(["£31,200", "9,250 GBP per year", "2024/25 fee: £12,000", "2024-25 fees: 9,535 gbp",
+                      "Fee for 2025/26 entry: $40,500.50", "2024/25: 14,000", "£9,000 - £10,000", "12000",
+                      "To be confirmed", None])
+    df = normalize_fees(fees)
+
+    assert df["fee_amount"].tolist()[:8] == [31200, 9250, 12000, 9535, 40500.5, 14000, 9000, 12000]
+    assert df["fee_amount"].iloc[8:].isna().all()
+    assert df["fee_currency"].where(df["fee_currency"].notna(), None).tolist()[:8] == \
+        ["GBP", "GBP", "GBP", "GBP", "USD", None, "GBP", None]
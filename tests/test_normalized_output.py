@@ -0,0 +1,92 @@
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+from course_crawler.pipelines import NormalizeReferenceTables, SaveCourseDelta
+from course_crawler.snapshots import iter_courses, snapshot_entry, update_manifest
+from course_crawler.stats.language_stats import load_language_requirements
+from course_crawler.stats.tuition_stats import load_tuitions
+from course_crawler.stats.university_review_stats import load_courses
+
+
+ACADEMIC_YEAR = "2024-2025"
+TIMESTAMP = "2024-01-01T00:00:00"
+
+
+def make_course(i: int) -> dict:
+    return {
+        "link": f"https://example.org/courses/{i}",
+        "title": f"Course {i}",
+        "study_level": "Graduate",
+        "qualification": "MSc",
+        "university_title": "University of Example",
+        "locations": ["Example"],
+        "description": "Description",
+        "about": "About",
+        "tuitions": [{"study_mode": "Full-time", "duration": "1 year", "student_category": "uk",
+                      "fee": "£%d,000" % (10 + i % 2)}] if i != 2 else [],
+        "start_dates": ["September 2024"],
+        "application_dates": [],
+        "entry_requirements": "Entry requirements",
+        "language_requirements": [{"language": "English", "test": "IELTS",
+                                   "score": "Overall: 7.0, Per component: 6.5"}],
+        "modules": [{"type": "Core", "title": "Module", "link": ""}]
+    }
+
+
+def write_normalized_snapshot(output_dir: Path, courses: list) -> Path:
+    spider = SimpleNamespace(name="example", timestamp=TIMESTAMP)
+    pipeline = NormalizeReferenceTables(
+        uri=str(output_dir / "%(name)s" / f"references_%(name)s_{ACADEMIC_YEAR}_%(timestamp)s%(shard)s.json"),
+        fields=["language_requirements", "tuitions"])
+
+    path = output_dir / "example" / f"courses_example_{ACADEMIC_YEAR}_{TIMESTAMP}.jsonl"
+    path.parent.mkdir(parents=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        for course in courses:
+            f.write(json.dumps(pipeline.process_item(course, spider), ensure_ascii=False) + "\n")
+    pipeline.close_spider(spider)
+
+    update_manifest(str(path.parent), snapshot_entry(str(path), item_count=len(courses)))
+    return path
+
+
+def test_normalized_snapshot_is_resolved(tmp_path):
+    courses = [make_course(i) for i in range(4)]
+    path = write_normalized_snapshot(tmp_path, courses)
+
+    assert "tuitions_ref" in json.loads(path.read_text(encoding='utf-8').splitlines()[0])
+    assert list(iter_courses(str(path))) == courses
+    assert list(iter_courses(str(path), fields=["link", "tuitions"])) == \
+        [{"link": x["link"], "tuitions": x["tuitions"]} for x in courses]
+
+
+def test_stats_read_normalized_snapshot(tmp_path):
+    courses = [make_course(i) for i in range(4)]
+    snapshot = {"path": str(write_normalized_snapshot(tmp_path, courses)),
+                "university": "example", "version": TIMESTAMP[:10]}
+
+    assert len(load_tuitions([snapshot])) == 3
+    assert len(load_language_requirements([snapshot])) == 4
+    courses_df = load_courses([snapshot])
+    assert courses_df["tuitions"].str.len().tolist() == [1, 1, 0, 1]
+    assert courses_df["language_requirements"].str.len().tolist() == [1, 1, 1, 1]
+
+
+def test_delta_against_normalized_snapshot(tmp_path):
+    courses = [make_course(i) for i in range(4)]
+    write_normalized_snapshot(tmp_path / "output", courses)
+
+    spider = SimpleNamespace(name="example", timestamp="2024-02-01T00:00:00")
+    pipeline = SaveCourseDelta(output_dir=str(tmp_path / "output"), delta_dir=str(tmp_path / "delta"))
+    pipeline.open_spider(spider)
+    changed_course = {**make_course(3), "tuitions": []}
+    for course in courses[:3] + [changed_course]:
+        pipeline.process_item(course, spider)
+    pipeline.close_spider(spider)
+
+    delta_path, = (tmp_path / "delta" / "example").glob("delta_*.json")
+    delta = json.loads(delta_path.read_text(encoding='utf-8'))
+    assert delta["unchanged_count"] == 3
+    assert delta["added"] == [] and delta["removed"] == []
+    assert [(x["link"], list(x["fields"])) for x in delta["changed"]] == [(changed_course["link"], ["tuitions"])]
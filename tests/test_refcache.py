@@ -0,0 +1,20 @@
+from course_crawler.refcache import ReferenceCache
+
+
+SOURCES = ["https://example.org/fees", "https://example.org/language-tests"]
+
+
+def test_reference_tables_are_cached(tmp_path):
+    cache = ReferenceCache(str(tmp_path), ttl=3600)
+    tables = {"fees": {"MSc": "£12,000"}, "language_certificates": {"IELTS": "7.0"}}
+
+    assert cache.save("example", SOURCES, tables)
+    assert cache.load("example", list(reversed(SOURCES))) == tables
+
+
+def test_empty_reference_tables_are_not_cached(tmp_path):
+    cache = ReferenceCache(str(tmp_path), ttl=3600)
+    cache.save("example", SOURCES, {"fees": {"MSc": "£12,000"}, "language_certificates": {"IELTS": "7.0"}})
+
+    assert not cache.save("example", SOURCES, {"fees": {}, "language_certificates": {"IELTS": "7.5"}})
+    assert cache.load("example", SOURCES)["language_certificates"] == {"IELTS": "7.0"}
@@ -0,0 +1,42 @@
+import json
+
+from course_crawler.snapshots import find_snapshot_entries, snapshot_entry, update_manifest
+from course_crawler.stats.drift_stats import latest_pairs
+
+
+ACADEMIC_YEAR = "2024-2025"
+
+
+def write_feed(directory, name: str, content: bytes, **kwargs) -> dict:
+    path = directory / name
+    path.write_bytes(content)
+    update_manifest(str(directory), snapshot_entry(str(path), **kwargs))
+    return path
+
+
+def test_find_snapshot_entries_skips_other_feeds(tmp_path):
+    directory = tmp_path / "example"
+    directory.mkdir()
+    courses = json.dumps([{"link": "https://example.org/courses/1"}]).encode("utf-8")
+    complete = write_feed(directory, f"courses_example_{ACADEMIC_YEAR}_2024-01-01T00:00:00.json", courses)
+    write_feed(directory, f"courses_example_{ACADEMIC_YEAR}_2024-01-01T00:00:00.xlsx", b"PK\x03\x04\xff")
+    write_feed(directory, f"courses_example_{ACADEMIC_YEAR}_2024-02-01T00:00:00.json", courses,
+               partial=True, finish_reason="shutdown")
+    write_feed(directory, f"courses_example_{ACADEMIC_YEAR}_2024-03-01T00:00:00_shard0of2.json", courses)
+
+    for pattern in [str(directory / "manifest.json"), str(directory / "courses_*")]:
+        assert [x["path"] for x in find_snapshot_entries([pattern])] == [str(complete)]
+
+
+def test_drift_pairs_skip_shards_and_partial_snapshots(tmp_path):
+    directory = tmp_path / "example"
+    directory.mkdir()
+    courses = json.dumps([{"link": "https://example.org/courses/1"}]).encode("utf-8")
+    previous = write_feed(directory, f"courses_example_{ACADEMIC_YEAR}_2024-01-01T00:00:00.json", courses)
+    latest = write_feed(directory, f"courses_example_{ACADEMIC_YEAR}_2024-02-01T00:00:00.json", courses)
+    write_feed(directory, f"courses_example_{ACADEMIC_YEAR}_2024-03-01T00:00:00.json", courses,
+               partial=True, finish_reason="shutdown")
+    write_feed(directory, f"courses_example_{ACADEMIC_YEAR}_2024-04-01T00:00:00_shard1of2.json", courses)
+
+    (old, new), = latest_pairs([str(directory / "manifest.json")])
+    assert (old["path"], new["path"]) == (str(previous), str(latest))